@@ -0,0 +1,156 @@
+"""
+Зведення доходів за великою кількістю файлів XML (map-reduce):
+    - файли розподіляються пакетами між процесами
+    - кожен процес опрацьовує файли правилами FileProfitXML (читання, очищення, нормалізація декларацій)
+      і зводить записи до часткових сум за ключем (платник, рік, квартал, ознака доходу, агент)
+    - часткові суми об'єднуються у головному процесі порціями (обмеження використання пам'яті)
+    - результат - екземпляр FileProfitXML, придатний для наявного експорту зведених таблиць Excel
+"""
+
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+import pandas as pd
+
+from process_pool import run_bounded
+from xml_converter import FileProfitXML
+
+rollup_keys = ['g3s', 'g12', 'g11', 'g10', 'g6s']  # платник, рік, квартал, ознака доходу, агент
+rollup_sums = ['g8', 'g9', 'profit']  # дохід, податок, прибуток
+
+
+class RollupPartial:
+    """
+    Часткові результати зведення:
+        - sums: суми доходу/податку/прибутку та кількість записів (індекс - rollup_keys)
+        - names: кількість записів з кожним варіантом назви агента (індекс - g6s, g7s)
+        - persons: атрибути платника з першого запису (індекс - g3s; колонки g4s, g5)
+    """
+
+    def __init__(self, sums: pd.DataFrame = None, names: pd.Series = None, persons: pd.DataFrame = None):
+        self.sums = sums
+        self.names = names
+        self.persons = persons
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame):
+        """Зведення очищеного датафрейму одного файлу до часткових сум"""
+        grouped = df.groupby(rollup_keys, sort=False, dropna=False)
+        sums = grouped[rollup_sums].sum()
+        sums['rows'] = grouped.size()
+        names = df.groupby(['g6s', 'g7s'], sort=False).size()
+        persons = df.drop_duplicates('g3s').set_index('g3s')[['g4s', 'g5']]
+        return cls(sums, names, persons)
+
+    def merge(self, partials: List['RollupPartial']) -> 'RollupPartial':
+        """Об'єднання з іншими частковими результатами (суми за однаковими ключами додаються)"""
+        partials = [p for p in [self] + list(partials) if p.sums is not None]
+        if len(partials) == 0:
+            return RollupPartial()
+        if len(partials) == 1:
+            return partials[0]
+        sums = pd.concat([p.sums for p in partials])
+        sums = sums.groupby(level=list(range(len(rollup_keys))), sort=False, dropna=False).sum()
+        names = pd.concat([p.names for p in partials])
+        names = names.groupby(level=[0, 1], sort=False).sum()
+        persons = pd.concat([p.persons for p in partials])
+        persons = persons.loc[~persons.index.duplicated()]
+        return RollupPartial(sums, names, persons)
+
+    def to_df(self) -> pd.DataFrame:
+        """Формування датафрейму у структурі FileProfitXML (один рядок - одна група ключів)"""
+        columns = ['g2s', 'g3s', 'g4s', 'g5', 'g6s', 'g7s', 'g8', 'g9', 'profit', 'g10', 'g11', 'g12', 'rows']
+        if self.sums is None:
+            return pd.DataFrame(columns=columns)
+        df = self.sums.reset_index()
+        df.sort_values(['g3s', 'g12', 'g11', 'g10', 'g6s'], inplace=True, ignore_index=True)
+
+        # Канонічна назва агента - найчастіше вживана у всіх файлах:
+        names = self.names.reset_index(name='count')
+        names = names.sort_values('count', ascending=False, kind='stable').drop_duplicates('g6s')
+        df['g7s'] = df['g6s'].map(names.set_index('g6s')['g7s'])
+
+        # Атрибути платників та порядковий номер особи у зведенні:
+        persons = self.persons.sort_index()
+        persons['g2s'] = range(1, persons.shape[0] + 1)
+        df = df.join(persons, on='g3s')
+        return df[columns]
+
+
+def _reduce_files(files: List[str]) -> Tuple[RollupPartial, Dict[str, str]]:
+    """Етап map: опрацювання пакету файлів в окремому процесі та зведення до часткових сум"""
+    partials = []
+    warnings = {}
+    for file in files:
+        try:
+            inst = FileProfitXML(file)
+            if inst.read_xml():
+                warnings[file] = 'Помилка читання XML файлу\n'
+                continue
+            file_warnings = inst.fill_df()
+            if file_warnings:
+                warnings[file] = file_warnings
+            if inst.df.shape[0] == 0 or 'profit' not in inst.df.columns:
+                continue
+            partials.append(RollupPartial.from_df(inst.df))
+        except Exception as e:
+            warnings[file] = f'Помилка опрацювання файлу: {e}\n'
+    return RollupPartial().merge(partials), warnings
+
+
+def aggregate_files(files: Iterable[Union[str, Path]],
+                    workers: int = None,
+                    files_per_task: int = 8,
+                    max_pending: int = None,
+                    merge_every: int = 8,
+                    progress: Callable[[int, int], None] = None) -> Tuple[FileProfitXML, Dict[str, str]]:
+    """
+    Зведення доходів за переліком файлів XML
+
+    :param files: перелік файлів XML
+    :param workers: кількість процесів (None - кількість ядер, 1 - опрацювання у поточному процесі)
+    :param files_per_task: кількість файлів у пакеті одного завдання
+    :param max_pending: максимальна кількість завдань в обробці одночасно (None - workers * 2); разом з
+        files_per_task та merge_every обмежує кількість часткових результатів у пам'яті
+    :param merge_every: кількість отриманих часткових результатів, після якої вони об'єднуються
+    :param progress: функція progress(опрацьовано_файлів, всього_файлів)
+    :return: екземпляр FileProfitXML зі зведеним датафреймом та словник попереджень {файл: текст}
+    """
+    files = [str(f) for f in files]
+    batches = [files[i:i + files_per_task] for i in range(0, len(files), files_per_task)]
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+
+    result = RollupPartial()
+    buffer = []
+    warnings = {}
+    done_files = 0
+
+    def collect(partial: RollupPartial, batch_warnings: Dict[str, str], batch_size: int):
+        nonlocal result, done_files
+        warnings.update(batch_warnings)
+        buffer.append(partial)
+        if len(buffer) >= merge_every:
+            result = result.merge(buffer)
+            buffer.clear()
+        done_files += batch_size
+        if progress is not None:
+            progress(done_files, len(files))
+
+    if workers == 1:
+        for batch in batches:
+            collect(*_reduce_files(batch), len(batch))
+    else:
+        def on_error(batch: List[str], e: Exception):
+            failed = {f: f'Помилка процесу опрацювання: {e}\n' for f in batch}
+            collect(RollupPartial(), failed, len(batch))
+
+        # Подача нових завдань лише в межах ліміту (часткові результати не накопичуються у черзі):
+        run_bounded(_reduce_files, batches, lambda batch: (batch,),
+                    lambda batch, result: collect(*result, len(batch)), on_error, workers, max_pending=max_pending)
+
+    result = result.merge(buffer)
+    rollup = FileProfitXML.from_df(result.to_df())
+    rollup.employers['rows'] = rollup.df.groupby('g6s')['rows'].sum()  # кількість вихідних записів
+    return rollup, warnings
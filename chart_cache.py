@@ -0,0 +1,161 @@
+"""
+Кеш зображень графіків звітів (PNG) з адресацією за вмістом:
+    - ключ - хеш даних графіку (ряди, підписи) та параметрів побудови (вид графіку, стиль, dpi, версія matplotlib)
+    - у межах запуску зображення зберігаються у пам'яті процесу (обмеження за розміром, LRU)
+    - між запусками - у каталозі кешу (файл <ключ>.png, час зміни файлу - час останнього використання);
+      при перевищенні розміру каталогу видаляються найдавніше використані файли
+    - графік, наявний у кеші, додається до документа без звернення до matplotlib
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+cache_version = 1  # змінюється при зміні вигляду графіків (зображення попередніх версій не використовуються)
+
+
+class ChartCache:
+    """
+    Кеш зображень графіків: пам'ять процесу та (за потреби) каталог на диску
+    """
+
+    def __init__(self, directory: Union[str, Path, None] = None, max_bytes=256 * 2 ** 20,
+                 memory_bytes=32 * 2 ** 20, signature=''):
+        """
+        :param directory: каталог кешу між запусками (None - лише кеш у пам'яті)
+        :param max_bytes: максимальний розмір каталогу кешу
+        :param memory_bytes: максимальний розмір зображень у пам'яті процесу
+        :param signature: параметри побудови, спільні для всіх графіків (включаються до ключа)
+        """
+        self.signature = signature
+        self.memory_bytes = memory_bytes
+        self.memo = OrderedDict()
+        self._memo_size = 0
+        self._lock = threading.Lock()
+        self.directory = None
+        self.max_bytes = max_bytes
+        self._dir_size = 0
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            self.set_directory(directory, max_bytes)
+
+    def set_directory(self, directory: Union[str, Path, None], max_bytes: int = None):
+        """Підключення каталогу кешу між запусками (None - відключення)"""
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if directory is None:
+            self.directory = None
+            return
+        self.directory = Path(directory)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            dir_size = sum(f.stat().st_size for f in self.directory.glob('*.png'))
+        except OSError:
+            self.directory = None
+            return
+        with self._lock:
+            self._dir_size = dir_size
+
+    def key(self, kind: str, *data) -> str:
+        """Ключ графіку: хеш виду графіку, його даних (JSON) та спільних параметрів побудови"""
+        payload = json.dumps([cache_version, self.signature, kind, data], ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _remember(self, key: str, blob: bytes):
+        with self._lock:
+            if key in self.memo:
+                self.memo.move_to_end(key)
+                return
+            self.memo[key] = blob
+            self._memo_size += len(blob)
+            while self._memo_size > self.memory_bytes and len(self.memo) > 1:
+                _, old = self.memo.popitem(last=False)
+                self._memo_size -= len(old)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Зображення з кешу (пам'ять, потім каталог) або None"""
+        with self._lock:
+            blob = self.memo.get(key)
+            if blob is not None:
+                self.memo.move_to_end(key)
+        if blob is None and self.directory is not None:
+            file = self.directory / f'{key}.png'
+            try:
+                blob = file.read_bytes()
+                os.utime(file)  # час використання для LRU
+            except OSError:
+                blob = None
+            if blob is not None:
+                self._remember(key, blob)
+        return blob
+
+    def put(self, key: str, blob: bytes):
+        """Збереження зображення у кеші (пам'ять та каталог)"""
+        self._remember(key, blob)
+        if self.directory is None:
+            return
+        file = self.directory / f'{key}.png'
+        tmp_file = file.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            tmp_file.write_bytes(blob)
+        except OSError:
+            return
+        # Заміна файлу, облік розміру каталогу та видалення файлів - під блокуванням (виклики з декількох потоків):
+        with self._lock:
+            try:
+                old_size = file.stat().st_size  # файл замінюється - його розмір вже враховано
+            except OSError:
+                old_size = 0
+            try:
+                tmp_file.replace(file)
+            except OSError:
+                return
+            self._dir_size += len(blob) - old_size
+            if self._dir_size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Видалення найдавніше використаних файлів каталогу до 90% максимального розміру (під блокуванням)"""
+        files = []
+        for file in self.directory.glob('*.png'):
+            try:
+                stat = file.stat()
+            except OSError:  # файл видалено іншим процесом
+                continue
+            files.append((stat.st_mtime, stat.st_size, file))
+        files.sort(key=lambda item: item[0])
+        size = sum(item[1] for item in files)
+        for _, file_size, file in files:
+            if size <= self.max_bytes * 0.9:
+                break
+            try:
+                file.unlink()
+            except OSError:
+                continue
+            size -= file_size
+        self._dir_size = size
+
+    def image(self, key: str, render: Callable[[], io.BytesIO]) -> io.BytesIO:
+        """
+        Зображення графіку: з кешу або побудоване функцією render (та збережене у кеші)
+
+        :param key: ключ графіку (key)
+        :param render: функція побудови зображення
+        """
+        blob = self.get(key)
+        hit = blob is not None
+        if not hit:
+            blob = render().getvalue()
+            self.put(key, blob)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return io.BytesIO(blob)
@@ -0,0 +1,223 @@
+"""
+Побудова графіків звітів (matplotlib) без глобального стану pyplot:
+    - фігури створюються об'єктним API (Figure + FigureCanvasAgg) і не реєструються у pyplot, тому не
+      накопичуються у пам'яті процесу
+    - кожен потік має власні шаблони фігур (dpi, полотно), які очищуються після збереження зображення
+      і використовуються повторно
+    - стиль графіків (chart_style) застосовується до елементів кожної фігури явно (рамка, сітка, поділки, текст,
+      шрифт), без зміни глобальних rcParams - графіки різних потоків будуються одночасно, без блокування
+    - зображення кешуються за даними графіку (chart_cache): повторний графік з тими самими даними
+      не будується
+    - роздільна здатність зображення визначається шириною, з якою воно додається до документа (chart_ppi),
+      PNG зберігається з палітрою кольорів (Pillow) - у кілька разів менший розмір файлу
+"""
+
+import io
+import threading
+from pathlib import Path
+from typing import Callable, List, Union
+
+import matplotlib as mpl
+import matplotlib.style
+from matplotlib import font_manager
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure, SubplotParams
+from matplotlib.text import Text
+from PIL import Image
+
+from chart_cache import ChartCache
+
+chart_style = 'seaborn-v0_8-whitegrid'  # стиль графіків (у matplotlib < 3.6 - 'seaborn-whitegrid')
+chart_ppi = 150  # пікселів на дюйм ширини зображення у документі
+palette_colors = 256  # кількість кольорів палітри PNG (0 - повноколірне зображення RGBA)
+
+_style_rc = matplotlib.style.library.get(chart_style) or matplotlib.style.library['seaborn-whitegrid']
+# Шрифт стилю - перший встановлений шрифт переліку стилю (загальна назва 'sans-serif' визначається глобальними
+# rcParams), DejaVu Sans постачається з matplotlib:
+_installed_fonts = {entry.name for entry in font_manager.fontManager.ttflist}
+_style_font = next((font for font in _style_rc['font.sans-serif'] if font in _installed_fonts), 'DejaVu Sans')
+_templates = threading.local()
+
+# Спільний кеш зображень процесу (ключ включає стиль та версію matplotlib, параметри зображення - _image_options):
+chart_cache = ChartCache(signature=f'{chart_style}|{mpl.__version__}')
+
+
+def set_chart_cache(directory: Union[str, Path, None], max_bytes: int = None):
+    """Підключення каталогу для збереження зображень графіків між запусками програми (None - відключення)"""
+    chart_cache.set_directory(directory, max_bytes)
+
+
+def _image_options(target_cm: float) -> list:
+    """Параметри зображення, що впливають на результат (частина ключа кешу)"""
+    return [target_cm, chart_ppi, palette_colors]
+
+
+def palette_png(blob: bytes, colors: int = None) -> bytes:
+    """
+    Перетворення PNG на зображення з палітрою (без розсіювання - чіткі лінії та текст графіку) з оптимізованим
+    стисненням
+
+    :param colors: кількість кольорів палітри (None - palette_colors)
+    """
+    image = Image.open(io.BytesIO(blob)).convert('RGB')
+    image = image.quantize(colors=colors or palette_colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    memory_file = io.BytesIO()
+    image.save(memory_file, format='PNG', optimize=True)
+    return memory_file.getvalue()
+
+
+def _apply_style(fig: Figure):
+    """
+    Застосування стилю графіків (_style_rc) до елементів фігури: рамка та сітка осей, поділки (створюються
+    до рендерингу, щоб отримати ті самі властивості), колір та шрифт всього тексту
+    """
+    for ax in fig.axes:
+        ax.set_axisbelow(_style_rc['axes.axisbelow'])
+        ax.grid(_style_rc['axes.grid'], color=_style_rc['grid.color'], linestyle=_style_rc['grid.linestyle'])
+        for spine in ax.spines.values():
+            spine.set_edgecolor(_style_rc['axes.edgecolor'])
+            spine.set_linewidth(_style_rc['axes.linewidth'])
+        ax.tick_params(axis='x', which='major', colors=_style_rc['xtick.color'], length=_style_rc['xtick.major.size'],
+                       direction=_style_rc['xtick.direction'])
+        ax.tick_params(axis='y', which='major', colors=_style_rc['ytick.color'], length=_style_rc['ytick.major.size'],
+                       direction=_style_rc['ytick.direction'])
+        for axis in (ax.xaxis, ax.yaxis):
+            axis.get_majorticklabels()  # створення поділок (інакше - під час рендерингу з глобальними rcParams)
+            for tick in axis.get_major_ticks():
+                tick.gridline.set_solid_capstyle(_style_rc['lines.solid_capstyle'])
+    # Текст клітинок таблиць не входить до дочірніх елементів фігури (findobj):
+    cell_texts = [cell.get_text() for ax in fig.axes for table in ax.tables for cell in table.get_celld().values()]
+    for text in fig.findobj(Text) + cell_texts:
+        text.set_color(_style_rc['text.color'])
+        text.set_fontfamily(_style_font)
+    for ax in fig.axes:
+        ax.xaxis.label.set_color(_style_rc['axes.labelcolor'])
+        ax.yaxis.label.set_color(_style_rc['axes.labelcolor'])
+
+
+def render_png(kind: str, width: float, height: float, draw: Callable[[Figure], None],
+               target_cm: float) -> io.BytesIO:
+    """
+    Побудова графіку на шаблоні фігури потоку та збереження у PNG (у пам'яті); після збереження шаблон
+    очищується (елементи графіку звільняються одразу, а не при завершенні процесу)
+
+    :param kind: вид шаблону ('bar', 'pie', 'legend')
+    :param width: ширина, дюймів
+    :param height: висота, дюймів
+    :param draw: функція draw(fig), що додає елементи графіку
+    :param target_cm: ширина зображення у документі, см (визначає dpi)
+    """
+    dpi = chart_ppi * target_cm / 2.54 / width
+    if not hasattr(_templates, 'figures'):
+        _templates.figures = {}
+    figures = _templates.figures
+    memory_file = io.BytesIO()
+    if kind not in figures:
+        figures[kind] = Figure(facecolor=_style_rc['figure.facecolor'])
+        FigureCanvasAgg(figures[kind])
+    fig = figures[kind]
+    fig.set_size_inches(width, height)
+    fig.subplotpars = SubplotParams()  # поля - типові (subplots_adjust попереднього графіку не діє)
+    try:
+        draw(fig)
+        _apply_style(fig)
+        fig.savefig(memory_file, format='png', dpi=dpi, facecolor=_style_rc['figure.facecolor'])
+    finally:
+        fig.clear()
+    if palette_colors:
+        return io.BytesIO(palette_png(memory_file.getvalue()))
+    memory_file.seek(0)
+    return memory_file
+
+
+def bar_chart(columns: List[str], data_np: np.ndarray, rows: List[str], target_cm=17.0) -> io.BytesIO:
+    """
+    Стовпчиковий графік доходу та прибутку з таблицею значень (тис. грн.) під графіком
+
+    :param columns: підписи періодів
+    :param data_np: суми за рядками rows (масив рядків rows x періоди)
+    :param rows: назви рядків таблиці (дохід, податок, прибуток)
+    :param target_cm: ширина зображення у документі, см
+    """
+    data_np = np.asarray(data_np, dtype=float)
+    key = chart_cache.key('bar', list(columns), data_np.tolist(), list(rows), _image_options(target_cm))
+
+    def draw(fig: Figure):
+        values = np.linspace(0, int(np.amax(data_np)), 5)  # положення підписів осі y
+        values_lbl = np.linspace(0, int(np.amax(data_np)) // 1000, 5)  # підписи осі y
+
+        colors = mpl.colormaps['BuPu'](np.linspace(0, 0.5, len(rows)))
+        index = np.linspace(0.5, len(columns) - 0.5, len(columns))  # положення барів по осі х
+        bar_width = 0.5
+
+        cell_text = [['%d' % (x / 1000.0) for x in data_np[row]] for row in range(len(data_np))]
+        cell_text.reverse()
+
+        ax = fig.add_subplot()
+        ax.set_xlim(0, len(columns))
+        ax.bar(index, data_np[2], bar_width, color=colors[2], edgecolor='black')
+        ax.bar(index, data_np[0], bar_width, color=colors[1], edgecolor='black')
+
+        the_table = ax.table(cellText=cell_text, rowLabels=rows, colLabels=columns, loc='bottom')
+        the_table.scale(1, 2)
+
+        ax.set_ylabel("Тисяч грн.")
+        ax.set_yticks(values, ['%d' % val for val in values_lbl])
+        ax.set_xticks([])
+        fig.subplots_adjust(bottom=0.3)
+        ax.margins(x=0.0, y=0.05)
+    return chart_cache.image(key, lambda: render_png('bar', 10, 3.5, draw, target_cm))
+
+
+def pie_chart(labels: List[str], vals: List[float], target_cm=14.0) -> io.BytesIO:
+    """Круговий графік часток (у відсотках) з підписами секторів (target_cm - ширина у документі, см)"""
+    key = chart_cache.key('pie', [str(label) for label in labels], [float(v) for v in vals], _image_options(target_cm))
+
+    def draw(fig: Figure):
+        ax = fig.add_subplot()
+        ax.margins(x=0.0, y=0.05)
+        patches, texts, autotexts = ax.pie(vals,
+                                           labels=labels,
+                                           autopct='%1.0f%%',
+                                           shadow=True,
+                                           startangle=90,
+                                           frame=False,
+                                           radius=1.1,
+                                           wedgeprops={"edgecolor": "k", 'linewidth': 0.8},
+                                           labeldistance=1.2,
+                                           explode=[0.05] * len(vals))
+        for t in texts:
+            t.set_fontsize(24)
+        for t in autotexts:
+            t.set_fontsize(24)
+    return chart_cache.image(key, lambda: render_png('pie', 14, 6, draw, target_cm))
+
+
+def legend_table(order: List[str], desc: List[str], vals_lbl: List[str], target_cm=12.0) -> io.BytesIO:
+    """
+    Таблиця-легенда кругового графіку
+
+    :param order: номери секторів
+    :param desc: назви секторів
+    :param vals_lbl: суми секторів (текст)
+    :param target_cm: ширина зображення у документі, см
+    """
+    key = chart_cache.key('legend', list(order), [str(d) for d in desc], list(vals_lbl), _image_options(target_cm))
+
+    def draw(fig: Figure):
+        ax = fig.add_subplot()
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_frame_on(False)
+        table = ax.table(cellText=[[d, v] for d, v in zip(desc, vals_lbl)],
+                         rowLabels=order,
+                         colLabels=["Вид доходу", "Тис.грн."],
+                         loc='center',
+                         colWidths=[0.9, 0.3],
+                         cellLoc='center')
+        table.auto_set_font_size(False)
+        table.set_fontsize(14)
+        table.scale(1, 1.3)
+        ax.margins(x=0.0, y=0.05)
+    return chart_cache.image(key, lambda: render_png('legend', 8, 0.3 * len(vals_lbl), draw, target_cm))
@@ -0,0 +1,127 @@
+"""
+Скорочення найменувань організаційно-правових форм юридичних осіб:
+    - роздільники (ключі довідника без літер, напр. " - ") нормалізуються попереднім проходом, як і пробіли
+    - всі скорочення довідника об'єднані в один скомпільований регулярний вираз (один прохід по рядку)
+    - результати запам'ятовуються у пам'яті процесу
+    - за потреби кеш зберігається у файл JSON і використовується при наступних запусках
+"""
+
+import json
+import re
+import hashlib
+from pathlib import Path
+from typing import Union, Optional
+
+import pandas as pd
+
+from defines import dict_company_types
+
+
+class CompanyTitles:
+    """
+    Скорочувач найменувань юридичних осіб (ТОВАРИСТВО З ОБМЕЖЕНОЮ ВІДПОВІДАЛЬНІСТЮ -> ТОВ)
+    """
+
+    def __init__(self, company_types: dict = None, cache_file: Union[str, Path, None] = None):
+        """
+        :param company_types: словник "повна назва форми: скорочення" (типово - dict_company_types)
+        :param cache_file: файл JSON для збереження кешу між запусками (None - лише кеш у пам'яті)
+        """
+        company_types = dict_company_types if company_types is None else company_types
+        # Роздільники замінюються до скорочень (як перші ключі довідника у послідовній заміні), інакше заміна
+        # роздільника конкурує з довшими ключами, що його містять ("НАУКОВО - ВИРОБНИЧЕ..."):
+        self.separators = [(re.compile(re.escape(key)), value.upper()) for key, value in company_types.items()
+                           if not any(char.isalpha() for char in key)]
+        abbreviations = {key: value for key, value in company_types.items() if any(char.isalpha() for char in key)}
+        # Таблиця заміни (ключ у верхньому регістрі) та альтернатива з усіх ключів - довші мають пріоритет:
+        self.replacements = {key.upper(): value.upper() for key, value in abbreviations.items()}
+        keys = sorted(abbreviations.keys(), key=len, reverse=True)
+        self.pattern = re.compile('|'.join(re.escape(key) for key in keys), flags=re.IGNORECASE)
+        self.spaces = re.compile(' +')
+        # Підпис довідника - кеш, збережений з іншою версією довідника, не використовується:
+        self.signature = hashlib.sha1(json.dumps(company_types, ensure_ascii=False).encode('utf-8')).hexdigest()
+        self.memo = {}
+        self.cache_file = None
+        self._dirty = False
+        if cache_file is not None:
+            self.set_cache_file(cache_file)
+
+    def _replace(self, match) -> str:
+        return self.replacements.get(match.group(0).upper(), match.group(0))
+
+    def title(self, full_name: str) -> str:
+        """Скорочення одного найменування (з використанням кешу)"""
+        short = self.memo.get(full_name)
+        if short is None:
+            short = self.spaces.sub(' ', full_name)
+            for separator, value in self.separators:
+                short = separator.sub(value, short)
+            short = self.pattern.sub(self._replace, short)
+            self.memo[full_name] = short
+            self._dirty = True
+        return short
+
+    def titles(self, names: pd.Series) -> pd.Series:
+        """
+        Скорочення колонки найменувань: обчислюються лише унікальні значення, відсутні у кеші
+
+        :param names: серія найменувань (значення NaN залишаються без змін)
+        :return: серія скорочених найменувань з тим самим індексом
+        """
+        for name in pd.unique(names.dropna()):
+            if name not in self.memo:
+                self.title(str(name))
+        return names.map(self.memo)
+
+    def set_cache_file(self, cache_file: Union[str, Path]):
+        """Підключення файлу кешу: завантаження збережених раніше скорочень (якщо довідник не змінювався)"""
+        self.cache_file = Path(cache_file)
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(stored, dict) and stored.get('signature') == self.signature:
+            self.memo.update(stored.get('titles', {}))
+
+    def save(self, cache_file: Union[str, Path, None] = None) -> bool:
+        """
+        Збереження кешу у файл JSON (лише якщо з'явились нові записи)
+
+        :return: True - кеш збережено або зберігати нічого, False - помилка запису
+        """
+        cache_file = Path(cache_file) if cache_file is not None else self.cache_file
+        if cache_file is None or not self._dirty:
+            return True
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(cache_file.suffix + '.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'signature': self.signature, 'titles': self.memo}, f, ensure_ascii=False)
+            tmp_file.replace(cache_file)
+        except OSError:
+            return False
+        self._dirty = False
+        return True
+
+
+# Спільний екземпляр процесу:
+company_titles = CompanyTitles()
+
+
+def company_title(full_name: str) -> str:
+    """Застосування скорочень до найменування організаційно-правової форми юридичної особи"""
+    return company_titles.title(full_name)
+
+
+def save_titles_cache() -> bool:
+    """Збереження кешу скорочень у підключений файл (set_titles_cache), якщо з'явились нові записи"""
+    return company_titles.save()
+
+
+def set_titles_cache(cache_file: Optional[Union[str, Path]]):
+    """Підключення файлу для збереження кешу скорочень між запусками програми"""
+    if cache_file is None:
+        company_titles.cache_file = None
+    else:
+        company_titles.set_cache_file(cache_file)
@@ -0,0 +1,278 @@
+"""
+Колонковий набір даних на диску для тривалого зберігання очищених витягів:
+    - записи розподіляються на частини за роком (g12) та кошиком платника (crc32 РНОКПП % buckets)
+    - кожна колонка частини - окремий файл .npy (числа, дати - як є, рядки - коди словника колонки); колонки
+      об'єктів з нерядковими значеннями не підтримуються (ValueError до зміни каталогу)
+    - словники рядкових колонок спільні для набору (масиви рядків фіксованої довжини)
+    - опис набору (колонки, типи, частини, кількість записів) - manifest.json
+    - разом з записами зберігаються довідник агентів та виключені проміжні декларації (для доповнення даних)
+    - файли читаються з np.load(mmap_mode='r'): з диска завантажуються лише потрібні частини та колонки
+"""
+
+import json
+import shutil
+import zlib
+from pathlib import Path
+from typing import Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+
+dataset_format = 'skarb-columns'
+dataset_version = 1
+row_id = 'row_id'  # службова колонка - порядковий номер запису (відновлення порядку записів)
+year_column = 'g12'
+person_column = 'g3s'
+restored_dtypes = ('category', 'string')  # типи рядкових колонок, що відновлюються під час читання
+
+
+def person_bucket(person, buckets: int) -> int:
+    """Кошик платника: стабільний між запусками хеш РНОКПП (crc32) за модулем кількості кошиків"""
+    return zlib.crc32(str(person).encode('utf-8')) % buckets
+
+
+def _is_native(column: pd.Series) -> bool:
+    """Колонка зберігається масивом numpy як є (числа, логічні значення, дати та інтервали без часового поясу)"""
+    return isinstance(column.dtype, np.dtype) and column.dtype.kind in 'iufbmM'
+
+
+def _check_column(column: pd.Series):
+    """Перевірка підтримки колонки: значення колонок, що кодуються словником, мають бути рядками"""
+    if _is_native(column):
+        return
+    values = pd.unique(column.dropna())
+    unsupported = {type(value).__name__ for value in values if not isinstance(value, str)}
+    if unsupported:
+        raise ValueError(f"Колонка {column.name}: непідтримувані типи значень ({', '.join(sorted(unsupported))}) - "
+                         f"у наборі даних зберігаються числа, дати та рядки")
+
+
+def _encode_column(column: pd.Series):
+    """
+    Підготовка колонки до запису: числові колонки та дати - масив numpy, інші - коди (int32, -1 - відсутнє
+    значення) та словник унікальних значень (рядки)
+
+    :return: (масив значень або кодів, словник або None)
+    """
+    if _is_native(column):
+        return column.to_numpy(), None
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    dictionary = np.array([str(value) for value in uniques], dtype=str) if len(uniques) else np.array([], 'U1')
+    return codes.astype(np.int32), dictionary
+
+
+def _decode_column(values: np.ndarray, dictionary: np.ndarray = None) -> np.ndarray:
+    """Відновлення значень колонки (рядки - з кодів словника, відсутні - None)"""
+    if dictionary is None:
+        return values
+    decoded = np.empty(len(values), dtype=object)
+    present = values >= 0
+    decoded[present] = dictionary[values[present]].astype(object)
+    decoded[~present] = None
+    return decoded
+
+
+def _encode_table(df: pd.DataFrame, directory: Path, prefix='') -> tuple:
+    """
+    Кодування колонок датафрейму та запис словників рядкових колонок (dict_<prefix><колонка>.npy)
+
+    :return: (словник {колонка: масив значень/кодів}, опис колонок для manifest)
+    """
+    encoded = {}
+    columns = {}
+    for col in df.columns:
+        values, dictionary = _encode_column(df[col])
+        if dictionary is not None:
+            np.save(directory / f'dict_{prefix}{col}.npy', dictionary, allow_pickle=False)
+        encoded[col] = values
+        columns[col] = {'dtype': str(values.dtype), 'dictionary': dictionary is not None}
+        if dictionary is not None and str(df[col].dtype) in restored_dtypes:
+            columns[col]['source_dtype'] = str(df[col].dtype)  # відновлюється під час читання
+    return encoded, columns
+
+
+def _restore_dtypes(df: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """Відновлення типів рядкових колонок (category, string) за описом колонок manifest"""
+    dtypes = {col: meta['source_dtype'] for col, meta in columns.items() if col in df and meta.get('source_dtype')}
+    return df.astype(dtypes) if dtypes else df
+
+
+def _write_table(directory: Path, encoded: dict, rows: np.ndarray = None):
+    """Запис колонок (усіх записів або позицій rows) у файли .npy каталогу"""
+    directory.mkdir(parents=True, exist_ok=True)
+    for col, values in encoded.items():
+        np.save(directory / f'{col}.npy', values if rows is None else values[rows], allow_pickle=False)
+
+
+def save_dataset(df: pd.DataFrame, directory: Union[str, Path], employers: pd.DataFrame = None,
+                 buckets: int = 16, declar_dropped: pd.DataFrame = None) -> dict:
+    """
+    Запис очищеного датафрейму у колонковий набір даних (вміст каталогу замінюється)
+
+    :param df: очищений датафрейм FileProfitXML
+    :param directory: каталог набору
+    :param employers: довідник агентів (зберігається разом з набором)
+    :param buckets: кількість кошиків платників у межах року
+    :param declar_dropped: проміжні декларації, виключені під час очищення (FileProfitXML.declar_dropped)
+    :return: опис набору (manifest)
+    """
+    directory = Path(directory)
+    for table in (df, employers, declar_dropped):
+        if table is not None:
+            for col in table.columns:
+                _check_column(table[col])
+    if employers is not None:
+        _check_column(employers.index.to_series(name='g6s'))
+    if directory.exists():
+        # Перевірка не через assert (вимикається python -O) - інакше видаляється довільний каталог користувача:
+        if not directory.is_dir() or (not (directory / 'manifest.json').exists() and any(directory.iterdir())):
+            raise ValueError(f"Каталог {directory} не є набором даних і не порожній")
+        shutil.rmtree(directory)
+    directory.mkdir(parents=True)
+
+    df = df.assign(**{row_id: np.arange(df.shape[0], dtype=np.int64)})
+    encoded, columns = _encode_table(df, directory)
+
+    # Кошик обчислюється один раз для кожного платника:
+    persons, person_codes = np.unique(df[person_column].astype(str).to_numpy(), return_inverse=True)
+    person_buckets = np.array([person_bucket(p, buckets) for p in persons], dtype=np.int64)[person_codes]
+    partitions = []
+    for (year, bucket), rows in sorted(df.groupby([df[year_column].to_numpy(), person_buckets]).indices.items()):
+        path = f'year={year}/bucket={bucket:03d}'
+        _write_table(directory / path, encoded, rows)
+        partitions.append({'path': path, 'year': int(year), 'bucket': int(bucket), 'rows': int(len(rows))})
+
+    employers_columns = None
+    if employers is not None:
+        emp_encoded, employers_columns = _encode_table(employers.rename_axis('g6s').reset_index(), directory,
+                                                       prefix='employers_')
+        _write_table(directory / 'employers', emp_encoded)
+
+    dropped_columns = None
+    if declar_dropped is not None:
+        dropped_encoded, dropped_columns = _encode_table(declar_dropped, directory, prefix='dropped_')
+        _write_table(directory / 'declar_dropped', dropped_encoded)
+
+    manifest = {'format': dataset_format,
+                'version': dataset_version,
+                'rows': int(df.shape[0]),
+                'buckets': buckets,
+                'columns': columns,
+                'employers': employers_columns,
+                'declar_dropped': dropped_columns,
+                'partitions': partitions}
+    # Опис записується останнім - набір без manifest.json вважається незавершеним:
+    with open(directory / 'manifest.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+
+class ColumnDataset:
+    """
+    Колонковий набір даних, відкритий для читання: файли колонок відображаються у пам'ять (mmap) лише під
+    час вибірки потрібних частин та колонок
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        with open(self.directory / 'manifest.json', 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != dataset_format:
+            raise ValueError(f"Каталог {self.directory} не містить колонковий набір даних")
+        if self.manifest.get('version') != dataset_version:
+            raise ValueError(f"Непідтримувана версія набору даних: {self.manifest.get('version')}")
+        self.columns = [col for col in self.manifest['columns'] if col != row_id]
+        self._dictionaries = {}
+
+    def _dictionary(self, name: str) -> np.ndarray:
+        if name not in self._dictionaries:
+            self._dictionaries[name] = np.load(self.directory / f'dict_{name}.npy', mmap_mode='r')
+        return self._dictionaries[name]
+
+    def column(self, path: Union[str, Path], col: str) -> np.ndarray:
+        """Масив колонки частини, відображений у пам'ять (без завантаження файлу)"""
+        return np.load(self.directory / path / f'{col}.npy', mmap_mode='r')
+
+    def partitions(self, years: Iterable[int] = None, persons: Iterable = None) -> List[dict]:
+        """
+        Частини набору, що можуть містити записи відібраних років та платників
+
+        :param years: роки (None - всі)
+        :param persons: РНОКПП платників (None - всі)
+        """
+        years = None if years is None else {int(year) for year in years}
+        buckets = None if persons is None else {person_bucket(p, self.manifest['buckets']) for p in persons}
+        return [part for part in self.manifest['partitions']
+                if (years is None or part['year'] in years) and (buckets is None or part['bucket'] in buckets)]
+
+    def read(self, columns: Iterable[str] = None, years: Iterable[int] = None,
+             persons: Iterable = None) -> pd.DataFrame:
+        """
+        Вибірка записів у датафрейм (у початковому порядку записів)
+
+        :param columns: колонки (None - всі)
+        :param years: роки (None - всі)
+        :param persons: РНОКПП платників (None - всі)
+        """
+        columns = self.columns if columns is None else list(columns)
+        persons = None if persons is None else [str(p) for p in persons]
+        person_codes = None
+        if persons is not None:
+            person_codes = pd.Index(self._dictionary(person_column)).get_indexer(persons)
+            person_codes = person_codes[person_codes >= 0]
+        frames = []
+        for part in self.partitions(years, persons):
+            order = np.asarray(self.column(part['path'], row_id))
+            mask = None
+            if person_codes is not None:
+                mask = np.isin(self.column(part['path'], person_column), person_codes)
+                order = order[mask]
+            data = {row_id: order}
+            for col in columns:
+                values = self.column(part['path'], col)
+                values = np.asarray(values[mask] if mask is not None else values)
+                dictionary = self._dictionary(col) if self.manifest['columns'][col]['dictionary'] else None
+                data[col] = _decode_column(values, dictionary)
+            frames.append(pd.DataFrame(data))
+
+        if not frames:
+            empty = pd.DataFrame({col: pd.Series(dtype=self.manifest['columns'][col]['dtype']
+                                                 if not self.manifest['columns'][col]['dictionary'] else object)
+                                  for col in columns})
+            return _restore_dtypes(empty, self.manifest['columns'])
+        df = pd.concat(frames, ignore_index=True)
+        df.sort_values(row_id, inplace=True, kind='stable')
+        return _restore_dtypes(df.drop(columns=row_id).reset_index(drop=True), self.manifest['columns'])
+
+    def _table(self, name: str, prefix: str) -> Union[pd.DataFrame, None]:
+        """Таблиця, збережена разом з набором в окремому каталозі name (None - не зберігалась)"""
+        columns = self.manifest.get(name)
+        if columns is None:
+            return None
+        data = {}
+        for col, meta in columns.items():
+            dictionary = self._dictionary(f'{prefix}{col}') if meta['dictionary'] else None
+            data[col] = _decode_column(np.asarray(self.column(name, col)), dictionary)
+        return _restore_dtypes(pd.DataFrame(data, columns=list(columns)), columns)
+
+    def employers(self) -> Union[pd.DataFrame, None]:
+        """Довідник агентів, збережений разом з набором (None - не зберігався)"""
+        if not self.manifest.get('employers'):
+            return None
+        return self._table('employers', 'employers_').set_index('g6s')
+
+    def declar_dropped(self, years: Iterable[int] = None, persons: Iterable = None) -> Union[pd.DataFrame, None]:
+        """
+        Виключені проміжні декларації відібраних років та платників (None - не зберігались)
+
+        :param years: роки (None - всі)
+        :param persons: РНОКПП платників (None - всі)
+        """
+        dropped = self._table('declar_dropped', 'dropped_')
+        if dropped is None or dropped.empty:
+            return dropped
+        if years is not None:
+            dropped = dropped.loc[dropped[year_column].isin([int(year) for year in years])]
+        if persons is not None:
+            dropped = dropped.loc[dropped[person_column].astype(str).isin([str(p) for p in persons])]
+        return dropped.reset_index(drop=True)
@@ -0,0 +1,206 @@
+"""
+Діаграми Word (DrawingML) для документів python-docx:
+    - частина діаграми (word/charts/chartN.xml) формується з агрегованих рядів даних без растеризації
+    - значення рядів зберігаються у діаграмі (кеш) та у вбудованій книзі Excel (word/embeddings), тому
+      діаграму можна редагувати у Word ("Змінити дані")
+    - діаграма додається до абзацу документа як вбудований (inline) графічний об'єкт
+"""
+
+import io
+import weakref
+from typing import Dict, List, Sequence
+from xml.sax.saxutils import escape
+
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.part import Part
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docx.oxml.shape import CT_Inline
+from docx.shape import InlineShape
+from docx.shared import Length
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+chart_uri = 'http://schemas.openxmlformats.org/drawingml/2006/chart'
+bar_colors = ['8c95c6', 'f7fcfd', 'bfd3e6']  # кольори рядів стовпчикової діаграми (BuPu, як у графіках matplotlib)
+sheet_name = 'Sheet1'
+
+_shape_ids = weakref.WeakKeyDictionary()  # останній ідентифікатор графічного об'єкта {частина документа: id}
+
+
+def _workbook_blob(categories: List[str], series: Dict[str, Sequence[float]], number_format: str) -> bytes:
+    """Вбудована книга Excel з даними діаграми: категорії - колонка A, ряди - колонки B, C..."""
+    book = Workbook()
+    sheet = book.active
+    sheet.title = sheet_name
+    sheet.append([''] + list(series))
+    for pos, category in enumerate(categories):
+        sheet.append([category] + [float(values[pos]) for values in series.values()])
+    for col in range(2, len(series) + 2):
+        for (cell,) in sheet.iter_rows(min_row=2, min_col=col, max_col=col):
+            cell.number_format = number_format
+    memory_file = io.BytesIO()
+    book.save(memory_file)
+    return memory_file.getvalue()
+
+
+def _str_ref(ref: str, values: List[str]) -> str:
+    points = ''.join(f'<c:pt idx="{n}"><c:v>{escape(str(v))}</c:v></c:pt>' for n, v in enumerate(values))
+    return f'<c:strRef><c:f>{ref}</c:f><c:strCache><c:ptCount val="{len(values)}"/>{points}</c:strCache></c:strRef>'
+
+
+def _num_ref(ref: str, values: Sequence[float], number_format: str) -> str:
+    points = ''.join(f'<c:pt idx="{n}"><c:v>{float(v)!r}</c:v></c:pt>' for n, v in enumerate(values))
+    return (f'<c:numRef><c:f>{ref}</c:f><c:numCache><c:formatCode>{escape(number_format)}</c:formatCode>'
+            f'<c:ptCount val="{len(values)}"/>{points}</c:numCache></c:numRef>')
+
+
+def _series_xml(pos: int, name: str, categories: List[str], values: Sequence[float], number_format: str,
+                fmt: str = '') -> str:
+    """
+    Ряд діаграми з посиланнями на вбудовану книгу
+
+    :param pos: номер ряду (з 0)
+    :param fmt: елементи формату ряду (spPr, explosion, dLbls...) - між назвою та категоріями
+    """
+    col = get_column_letter(pos + 2)
+    last = len(categories) + 1
+    return (f'<c:ser><c:idx val="{pos}"/><c:order val="{pos}"/>'
+            f'<c:tx>{_str_ref(f"{sheet_name}!${col}$1", [name])}</c:tx>{fmt}'
+            f'<c:cat>{_str_ref(f"{sheet_name}!$A$2:$A${last}", categories)}</c:cat>'
+            f'<c:val>{_num_ref(f"{sheet_name}!${col}$2:${col}${last}", values, number_format)}</c:val></c:ser>')
+
+
+def _chart_space(plot_area: str, legend: bool, font_size: int) -> str:
+    legend_xml = '<c:legend><c:legendPos val="r"/><c:overlay val="0"/></c:legend>' if legend else ''
+    return (f'<c:chartSpace {nsdecls("c", "a", "r")}><c:date1904 val="0"/><c:roundedCorners val="0"/>'
+            f'<c:chart><c:autoTitleDeleted val="1"/><c:plotArea><c:layout/>{plot_area}</c:plotArea>{legend_xml}'
+            f'<c:plotVisOnly val="1"/><c:dispBlanksAs val="gap"/></c:chart>'
+            f'<c:txPr><a:bodyPr/><a:lstStyle/><a:p><a:pPr><a:defRPr sz="{font_size * 100}"/></a:pPr>'
+            f'<a:endParaRPr lang="uk-UA"/></a:p></c:txPr>'
+            f'<c:externalData r:id="rId1"><c:autoUpdate val="0"/></c:externalData></c:chartSpace>')
+
+
+def bar_chart_xml(categories: List[str], series: Dict[str, Sequence[float]], number_format='#,##0',
+                  axis_title: str = None, font_size=9) -> str:
+    """
+    Стовпчикова діаграма: ряди накладаються (перекриття 100%) у порядку series, під діаграмою - таблиця
+    даних з позначками рядів
+
+    :param categories: підписи категорій (періоди)
+    :param series: ряди {назва: значення за категоріями}
+    :param number_format: формат чисел (Excel)
+    :param axis_title: назва осі значень
+    """
+    sers = ''.join(_series_xml(pos, name, categories, values, number_format,
+                               fmt=f'<c:spPr><a:solidFill><a:srgbClr val="{bar_colors[pos % len(bar_colors)]}"/>'
+                                   f'</a:solidFill><a:ln><a:solidFill><a:srgbClr val="000000"/></a:solidFill>'
+                                   f'</a:ln></c:spPr><c:invertIfNegative val="0"/>')
+                   for pos, (name, values) in enumerate(series.items()))
+    title = ''
+    if axis_title:
+        title = (f'<c:title><c:tx><c:rich><a:bodyPr rot="-5400000" vert="horz"/><a:lstStyle/><a:p><a:r>'
+                 f'<a:t>{escape(axis_title)}</a:t></a:r></a:p></c:rich></c:tx><c:overlay val="0"/></c:title>')
+    plot_area = (f'<c:barChart><c:barDir val="col"/><c:grouping val="clustered"/><c:varyColors val="0"/>{sers}'
+                 f'<c:gapWidth val="100"/><c:overlap val="100"/><c:axId val="1"/><c:axId val="2"/></c:barChart>'
+                 f'<c:catAx><c:axId val="1"/><c:scaling><c:orientation val="minMax"/></c:scaling>'
+                 f'<c:delete val="0"/><c:axPos val="b"/><c:numFmt formatCode="General" sourceLinked="0"/>'
+                 f'<c:majorTickMark val="none"/><c:minorTickMark val="none"/><c:tickLblPos val="nextTo"/>'
+                 f'<c:crossAx val="2"/><c:crosses val="autoZero"/><c:auto val="1"/><c:lblAlgn val="ctr"/>'
+                 f'<c:lblOffset val="100"/><c:noMultiLvlLbl val="0"/></c:catAx>'
+                 f'<c:valAx><c:axId val="2"/><c:scaling><c:orientation val="minMax"/></c:scaling>'
+                 f'<c:delete val="0"/><c:axPos val="l"/><c:majorGridlines/>{title}'
+                 f'<c:numFmt formatCode="{escape(number_format)}" sourceLinked="0"/>'
+                 f'<c:majorTickMark val="none"/><c:minorTickMark val="none"/><c:tickLblPos val="nextTo"/>'
+                 f'<c:crossAx val="1"/><c:crosses val="autoZero"/><c:crossBetween val="between"/></c:valAx>'
+                 f'<c:dTable><c:showHorzBorder val="1"/><c:showVertBorder val="1"/><c:showOutline val="1"/>'
+                 f'<c:showKeys val="1"/></c:dTable>')
+    return _chart_space(plot_area, legend=False, font_size=font_size)
+
+
+def pie_chart_xml(categories: List[str], values: Sequence[float], name='', number_format='#,##0.00',
+                  show_names=True, font_size=10) -> str:
+    """
+    Кругова діаграма з відсотками (та назвами) секторів, сектори відокремлені
+
+    :param categories: назви секторів
+    :param values: значення секторів
+    :param show_names: підписувати сектори назвами (інакше - лише відсотки та легенда діаграми)
+    """
+    labels = (f'<c:dLbls><c:numFmt formatCode="0%" sourceLinked="0"/><c:spPr><a:noFill/><a:ln><a:noFill/></a:ln>'
+              f'</c:spPr><c:dLblPos val="bestFit"/><c:showLegendKey val="0"/><c:showVal val="0"/>'
+              f'<c:showCatName val="{int(show_names)}"/><c:showSerName val="0"/><c:showPercent val="1"/>'
+              f'<c:showBubbleSize val="0"/><c:showLeaderLines val="1"/></c:dLbls>')
+    fmt = (f'<c:spPr><a:ln w="9525"><a:solidFill><a:srgbClr val="000000"/></a:solidFill></a:ln></c:spPr>'
+           f'<c:explosion val="5"/>{labels}')
+    plot_area = (f'<c:pieChart><c:varyColors val="1"/>{_series_xml(0, name, categories, values, number_format, fmt)}'
+                 f'<c:firstSliceAng val="0"/></c:pieChart>')
+    return _chart_space(plot_area, legend=not show_names, font_size=font_size)
+
+
+def next_shape_id(document_part) -> int:
+    """
+    Ідентифікатор нового графічного об'єкта (wp:docPr) частини документа: пошук всіх ідентифікаторів частини
+    (next_id python-docx, тривалість зростає з розміром документа) виконується один раз, далі - лічильник
+    (графічні об'єкти додаються до частини через add_chart / add_picture)
+    """
+    shape_id = _shape_ids[document_part] + 1 if document_part in _shape_ids else document_part.next_id
+    _shape_ids[document_part] = shape_id
+    return shape_id
+
+
+def add_picture(run, image, width: Length = None, height: Length = None):
+    """
+    Додавання зображення до фрагменту (run) абзацу документа (як run.add_picture, ідентифікатор - next_shape_id)
+
+    :param image: шлях або файловий об'єкт зображення
+    """
+    document_part = run.part
+    r_id, picture = document_part.get_or_add_image(image)
+    cx, cy = picture.scaled_dimensions(width, height)
+    inline = CT_Inline.new_pic_inline(next_shape_id(document_part), r_id, picture.filename, cx, cy)
+    run._r.add_drawing(inline)
+    return InlineShape(inline)
+
+
+def add_chart(run, chart_xml: str, workbook_blob: bytes, width: Length, height: Length, name='Діаграма'):
+    """
+    Додавання діаграми до фрагменту (run) абзацу документа
+
+    :param run: фрагмент абзацу python-docx
+    :param chart_xml: розмітка частини діаграми (bar_chart_xml / pie_chart_xml)
+    :param workbook_blob: вбудована книга Excel з даними діаграми
+    :param width: ширина діаграми
+    :param height: висота діаграми
+    """
+    document_part = run.part
+    package = document_part.package
+    chart_part = Part(package.next_partname('/word/charts/chart%d.xml'), CT.DML_CHART,
+                      chart_xml.encode('utf-8'), package)
+    workbook_part = Part(package.next_partname('/word/embeddings/Microsoft_Excel_Worksheet%d.xlsx'), CT.SML_SHEET,
+                         workbook_blob, package)
+    chart_part.relate_to(workbook_part, RT.PACKAGE)  # rId1 - посилання externalData діаграми
+    r_id = document_part.relate_to(chart_part, RT.CHART)
+    shape_id = next_shape_id(document_part)
+    inline = parse_xml(f'<wp:inline {nsdecls("wp", "a", "c", "r")} distT="0" distB="0" distL="0" distR="0">'
+                       f'<wp:extent cx="{int(width)}" cy="{int(height)}"/>'
+                       f'<wp:effectExtent l="0" t="0" r="0" b="0"/>'
+                       f'<wp:docPr id="{shape_id}" name="{escape(name)} {shape_id}"/><wp:cNvGraphicFramePr/>'
+                       f'<a:graphic><a:graphicData uri="{chart_uri}"><c:chart r:id="{r_id}"/></a:graphicData>'
+                       f'</a:graphic></wp:inline>')
+    run._r.add_drawing(inline)
+    return chart_part
+
+
+def add_bar_chart(run, categories: List[str], series: Dict[str, Sequence[float]], width: Length, height: Length,
+                  number_format='#,##0', axis_title: str = None):
+    """Додавання стовпчикової діаграми (bar_chart_xml) з вбудованими даними"""
+    return add_chart(run, bar_chart_xml(categories, series, number_format, axis_title),
+                     _workbook_blob(categories, series, number_format), width, height)
+
+
+def add_pie_chart(run, categories: List[str], values: Sequence[float], width: Length, height: Length, name='',
+                  number_format='#,##0.00', show_names=True):
+    """Додавання кругової діаграми (pie_chart_xml) з вбудованими даними"""
+    return add_chart(run, pie_chart_xml(categories, values, name, number_format, show_names),
+                     _workbook_blob(categories, {name: values}, number_format), width, height)
@@ -0,0 +1,117 @@
+"""
+Збереження документів python-docx з оптимізацією пакета:
+    - пакет записується через публічний інтерфейс python-docx (частини пакета, їхній вміст та відношення),
+      опис типів вмісту ([Content_Types].xml) формується тут
+    - рівень стиснення zip задається під час збереження; вже стиснені частини (PNG, JPEG, вбудовані книги
+      Excel) записуються без повторного стиснення
+    - рядки великих таблиць (docx_tables.add_streamed_table) формуються та стискаються частинами під час запису
+      word/document.xml, без побудови дерева XML таблиці
+"""
+
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterable, Iterator, Union
+from xml.sax.saxutils import quoteattr
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+
+from docx_tables import streamed_rows
+
+stored_types = {CT.PNG, CT.JPEG, CT.GIF, CT.SML_SHEET}  # вміст вже стиснений
+stream_chunk = 2 ** 20  # розмір частин розмітки рядків, що записуються у zip
+
+
+class _ZipWriter:
+    """Запис частин пакета у zip із заданим рівнем стиснення"""
+
+    def __init__(self, pkg_file: Union[str, Path, IO], compresslevel: int):
+        self._zipf = ZipFile(pkg_file, 'w', compression=ZIP_DEFLATED, compresslevel=compresslevel)
+        self.stored = set()  # назви частин, що записуються без стиснення
+        self.streamed: Dict[str, Callable[[bytes], Iterable[bytes]]] = {}  # частини, що записуються частинами
+
+    def close(self):
+        self._zipf.close()
+
+    def write(self, pack_uri, blob):
+        name = pack_uri.membername
+        if name in self.streamed:
+            with self._zipf.open(name, 'w', force_zip64=True) as member:
+                for chunk in self.streamed[name](blob):
+                    member.write(chunk)
+            return
+        compress_type = ZIP_STORED if name in self.stored else None
+        self._zipf.writestr(name, blob, compress_type=compress_type)
+
+
+def _chunks(rows: Iterable[str]) -> Iterator[bytes]:
+    """Розмітка рядків частинами приблизно stream_chunk символів (UTF-8)"""
+    buffer = []
+    size = 0
+    for row in rows:
+        buffer.append(row)
+        size += len(row)
+        if size >= stream_chunk:
+            yield ''.join(buffer).encode('utf-8')
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _with_rows(rows: Dict[bytes, Callable[[], Iterable[str]]]) -> Callable[[bytes], Iterator[bytes]]:
+    """Запис розмітки частини з рядками таблиць замість маркерів (маркери вилучених таблиць не зустрічаються)"""
+
+    def chunks(blob: bytes) -> Iterator[bytes]:
+        found = sorted((blob.find(marker), marker) for marker in rows if marker in blob)
+        pos = 0
+        for start, marker in found:
+            yield blob[pos:start]
+            yield from _chunks(rows[marker]())
+            pos = start + len(marker)
+        yield blob[pos:]
+    return chunks
+
+
+def _content_types_xml(parts) -> bytes:
+    """
+    Розмітка [Content_Types].xml: типи за розширенням (Default) для відношень, XML та вже стиснених частин,
+    решта частин описується за назвою (Override)
+    """
+    defaults = {'rels': CT.OPC_RELATIONSHIPS, 'xml': CT.XML}
+    overrides = {}
+    for part in parts:
+        ext = part.partname.ext.lower()
+        if part.content_type in stored_types and defaults.setdefault(ext, part.content_type) == part.content_type:
+            continue
+        if defaults.get(ext) != part.content_type:
+            overrides[str(part.partname)] = part.content_type
+    items = [f'<Default Extension={quoteattr(ext)} ContentType={quoteattr(ct)}/>' for ext, ct in defaults.items()]
+    items += [f'<Override PartName={quoteattr(name)} ContentType={quoteattr(ct)}/>' for name, ct in overrides.items()]
+    return ('<?xml version=\'1.0\' encoding=\'UTF-8\' standalone=\'yes\'?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            + ''.join(items) + '</Types>').encode('utf-8')
+
+
+def save_document(document, file: Union[str, Path, IO], compresslevel=6):
+    """
+    Збереження документа python-docx (аналог document.save)
+
+    :param file: шлях або файловий об'єкт
+    :param compresslevel: рівень стиснення zip (0 - без стиснення, 1 - найшвидше, 9 - найменший розмір)
+    """
+    package = document.part.package
+    parts = list(package.iter_parts())
+    for part in parts:
+        part.before_marshal()
+    writer = _ZipWriter(str(file) if isinstance(file, Path) else file, compresslevel)
+    writer.stored = {part.partname.membername for part in parts if part.content_type in stored_types}
+    writer.streamed = {part.partname.membername: _with_rows(streamed_rows(part)) for part in parts
+                       if streamed_rows(part)}
+    writer.write(CONTENT_TYPES_URI, _content_types_xml(parts))
+    writer.write(PACKAGE_URI.rels_uri, package.rels.xml)
+    for part in parts:
+        writer.write(part.partname, part.blob)
+        if part.rels:
+            writer.write(part.partname.rels_uri, part.rels.xml)
+    writer.close()
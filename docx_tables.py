@@ -0,0 +1,229 @@
+"""
+Пакетна побудова таблиць документа Word (python-docx):
+    - розмітка WordprocessingML всіх рядків таблиці формується одним рядком тексту з колонок даних
+      (ширина, вирівнювання, заливка, жирний шрифт, об'єднання клітинок - під час формування)
+    - розмітка розбирається один раз і додається до таблиці - без звернень до rows[...]/cells[...]
+      python-docx, які щоразу створюють нові об'єкти рядків та клітинок
+    - результат відповідає таблиці, заповненій через cell.text та налаштованій властивостями python-docx
+    - рядки великих таблиць (add_streamed_table) не додаються до дерева документа: у таблиці залишається
+      маркер, а розмітка рядків формується та записується у word/document.xml частинами під час збереження
+      (docx_package.save_document)
+"""
+
+import itertools
+import re
+import weakref
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from lxml import etree
+from docx.section import Section
+from docx.shared import Emu, Length
+from docx.table import Table
+
+header_fill = 'd9d9d9'  # заливка заголовків таблиць
+
+_stream_ids = itertools.count(1)
+_streamed = weakref.WeakKeyDictionary()  # рядки таблиць, що записуються під час збереження {частина: {маркер: ...}}
+
+# Символи, недопустимі у XML 1.0 (керівні символи, крім табуляції та перенесення рядка, непарні сурогати, U+FFFE/FFFF):
+_xml_invalid = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+_align = {WD_PARAGRAPH_ALIGNMENT.LEFT: 'left',
+          WD_PARAGRAPH_ALIGNMENT.CENTER: 'center',
+          WD_PARAGRAPH_ALIGNMENT.RIGHT: 'right',
+          WD_PARAGRAPH_ALIGNMENT.JUSTIFY: 'both'}
+
+
+def _escape(text: str) -> str:
+    """Екранування тексту для розмітки XML (недопустимі у XML 1.0 символи вилучаються)"""
+    if _xml_invalid.search(text) is not None:
+        text = _xml_invalid.sub('', text)
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def run_content(text: str) -> str:
+    """
+    Вміст елемента w:r для тексту (як у python-docx: табуляція - w:tab, перенесення рядка - w:br,
+    пробіли на початку/в кінці - xml:space="preserve")
+    """
+    parts = []
+    buffer = []
+
+    def flush():
+        chunk = ''.join(buffer)
+        if chunk:
+            space = ' xml:space="preserve"' if len(chunk.strip()) < len(chunk) else ''
+            parts.append(f'<w:t{space}>{_escape(chunk)}</w:t>')
+        buffer.clear()
+
+    if '\t' not in text and '\n' not in text and '\r' not in text:
+        buffer.append(text)
+    else:
+        for char in text:
+            if char == '\t':
+                flush()
+                parts.append('<w:tab/>')
+            elif char in '\r\n':
+                flush()
+                parts.append('<w:br/>')
+            else:
+                buffer.append(char)
+    flush()
+    return ''.join(parts)
+
+
+class CellFormat:
+    """
+    Формат клітинок колонки: ширина, вирівнювання абзацу, вертикальне вирівнювання, жирний шрифт, заливка.
+    Незмінні частини розмітки клітинки формуються один раз.
+    """
+
+    def __init__(self, width: Length, align: WD_PARAGRAPH_ALIGNMENT = None, v_align: str = None, bold=False,
+                 fill: str = None):
+        """
+        :param width: ширина колонки
+        :param align: вирівнювання тексту абзацу
+        :param v_align: вертикальне вирівнювання ('top', 'center', 'bottom')
+        :param bold: жирний шрифт
+        :param fill: колір заливки (hex, напр. 'd9d9d9')
+        """
+        self.width = f'<w:tcW w:type="dxa" w:w="{width.twips}"/>'
+        self.shading = f'<w:shd w:fill="{fill}"/>' if fill else ''
+        self.v_align = f'<w:vAlign w:val="{v_align}"/>' if v_align else ''
+        self.paragraph = f'<w:p><w:pPr><w:jc w:val="{_align[align]}"/></w:pPr>' if align is not None else '<w:p>'
+        self.run = '<w:r><w:rPr><w:b/></w:rPr>' if bold else '<w:r>'
+
+    def xml(self, text: str, v_merge: Optional[str] = None) -> str:
+        """
+        Розмітка клітинки
+
+        :param v_merge: вертикальне об'єднання: 'restart' - перша клітинка групи, 'continue' - наступні
+            (вміст та формат таких клітинок визначає перша клітинка групи, тому вони містять порожній абзац)
+        """
+        if v_merge == 'continue':
+            return f'<w:tc><w:tcPr>{self.width}<w:vMerge/></w:tcPr><w:p/></w:tc>'
+        merge = '<w:vMerge w:val="restart"/>' if v_merge == 'restart' else ''
+        return (f'<w:tc><w:tcPr>{self.width}{merge}{self.shading}{self.v_align}</w:tcPr>'
+                f'{self.paragraph}{self.run}{run_content(text)}</w:r></w:p></w:tc>')
+
+
+def vertical_merges(rows: Sequence[Sequence[str]]) -> List[List[Optional[str]]]:
+    """
+    Ознаки вертикального об'єднання клітинок за даними: порожня клітинка продовжує групу непорожньої клітинки
+    над нею (тієї ж колонки), група з однієї клітинки не об'єднується
+
+    :param rows: значення клітинок рядків (текст, клітинки, що мають злитись вертикально - порожні)
+    :return: ознаки для rows_xml ('restart', 'continue' або None)
+    """
+    merges = [[None] * len(row) for row in rows]
+    for col in range(len(rows[0]) if rows else 0):
+        first = None  # рядок початку поточної групи
+        for pos, row in enumerate(rows):
+            if row[col] != '':
+                first = pos
+            elif first is not None:
+                merges[first][col] = 'restart'
+                merges[pos][col] = 'continue'
+    return merges
+
+
+def iter_rows_xml(rows: Iterable[Sequence[str]], formats: Sequence[CellFormat],
+                  merges: Iterable[Sequence[Optional[str]]] = None) -> Iterator[str]:
+    """
+    Розмітка рядків таблиці (по рядку)
+
+    :param rows: значення клітинок рядків (текст)
+    :param formats: формати колонок
+    :param merges: ознаки вертикального об'єднання клітинок рядків (CellFormat.xml, None - без об'єднання)
+    """
+    if merges is None:
+        return ('<w:tr>' + ''.join(fmt.xml(str(text)) for fmt, text in zip(formats, row)) + '</w:tr>'
+                for row in rows)
+    return ('<w:tr>' + ''.join(fmt.xml(str(text), merge) for fmt, text, merge in zip(formats, row, merge_row))
+            + '</w:tr>' for row, merge_row in zip(rows, merges))
+
+
+def rows_xml(rows: Iterable[Sequence[str]], formats: Sequence[CellFormat],
+             merges: Iterable[Sequence[Optional[str]]] = None) -> str:
+    """Розмітка рядків таблиці (параметри - iter_rows_xml)"""
+    return ''.join(iter_rows_xml(rows, formats, merges))
+
+
+def append_rows(table: Table, xml: str):
+    """Додавання розмітки рядків до таблиці (один розбір XML для всіх рядків)"""
+    parsed = parse_xml(f'<w:tbl {nsdecls("w")}>{xml}</w:tbl>')
+    table._tbl.extend(list(parsed))
+
+
+def block_width(document) -> Length:
+    """
+    Ширина тексту останнього розділу документа (як у document.add_table): параметри розділу - w:sectPr тіла
+    документа, без пошуку всіх w:sectPr (document.sections), тривалість якого зростає з розміром документа
+    """
+    sect_pr = document.element.body.sectPr
+    if sect_pr is None:
+        return document._block_width
+    section = Section(sect_pr, document.part)
+    return Emu(section.page_width - section.left_margin - section.right_margin)
+
+
+def add_grid_table(document, headers: List[str], rows: Iterable[Sequence[str]], widths: Sequence[Length],
+                   aligns: Sequence[WD_PARAGRAPH_ALIGNMENT], style='Table Grid',
+                   header_formats: Sequence[CellFormat] = None, formats: Sequence[CellFormat] = None,
+                   merges: Iterable[Sequence[Optional[str]]] = None) -> Table:
+    """
+    Додавання до документа таблиці з сіткою: заголовки (жирні, по центру, з заливкою) та рядки даних
+
+    :param headers: заголовки колонок
+    :param rows: значення клітинок рядків (текст)
+    :param widths: ширина колонок
+    :param aligns: вирівнювання тексту колонок
+    :param header_formats: формати заголовків (None - типові)
+    :param formats: формати колонок даних (None - ширина та вирівнювання widths/aligns)
+    :param merges: ознаки вертикального об'єднання клітинок (rows_xml)
+    """
+    table = _new_table(document, len(headers), style)
+    if header_formats is None:
+        header_formats = _header_formats(widths)
+    if formats is None:
+        formats = [CellFormat(width, align) for width, align in zip(widths, aligns)]
+    append_rows(table, rows_xml([headers], header_formats) + rows_xml(rows, formats, merges))
+    return table
+
+
+def _new_table(document, cols: int, style: str) -> Table:
+    table = document._body.add_table(0, cols, block_width(document))
+    table.allow_autofit = False
+    table.style = style
+    return table
+
+
+def _header_formats(widths: Sequence[Length]) -> List[CellFormat]:
+    return [CellFormat(width, WD_PARAGRAPH_ALIGNMENT.CENTER, bold=True, fill=header_fill) for width in widths]
+
+
+def add_streamed_table(document, headers: List[str], rows: Callable[[], Iterable[Sequence[str]]],
+                       widths: Sequence[Length], aligns: Sequence[WD_PARAGRAPH_ALIGNMENT],
+                       style='Table Grid') -> Table:
+    """
+    Додавання до документа таблиці з сіткою (як add_grid_table), рядки даних якої записуються у файл під час
+    збереження документа (docx_package.save_document): до дерева документа додається лише рядок заголовків
+    та маркер рядків (коментар XML)
+
+    :param rows: функція, що повертає значення клітинок рядків (викликається під час кожного збереження)
+    """
+    table = _new_table(document, len(headers), style)
+    append_rows(table, rows_xml([headers], _header_formats(widths)))
+    formats = [CellFormat(width, align) for width, align in zip(widths, aligns)]
+    marker = f'stream-rows:{next(_stream_ids)}'
+    table._tbl.append(etree.Comment(marker))
+    _streamed.setdefault(document.part, {})[f'<!--{marker}-->'.encode('utf-8')] = lambda: iter_rows_xml(rows(), formats)
+    return table
+
+
+def streamed_rows(part) -> Dict[bytes, Callable[[], Iterator[str]]]:
+    """Рядки таблиць частини документа, що записуються під час збереження {маркер у розмітці: рядки}"""
+    return _streamed.get(part, {})
@@ -0,0 +1,55 @@
+"""
+Зміст документа Word (python-docx):
+    - зміст - поле TOC, побудоване з абзаців стилів з рівнем структури (outlineLvl), тому номери сторінок
+      визначає Word під час відкриття документа (python-docx розмітку сторінок не виконує)
+    - у налаштуваннях документа встановлюється оновлення полів при відкритті (updateFields)
+"""
+
+from xml.sax.saxutils import escape
+
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+# Елементи налаштувань документа, що за схемою WordprocessingML розташовуються після w:updateFields:
+_settings_after_update = ('w:hdrShapeDefaults', 'w:footnotePr', 'w:endnotePr', 'w:compat', 'w:docVars', 'w:rsids',
+                          'm:mathPr', 'w:attachedSchema', 'w:themeFontLang', 'w:clrSchemeMapping',
+                          'w:doNotIncludeSubdocsInStats', 'w:doNotAutoCompressPictures', 'w:forceUpgrade',
+                          'w:captions', 'w:readModeInkLockDown', 'w:smartTagType', 'sl:schemaLibrary',
+                          'w:shapeDefaults', 'w:doNotEmbedSmartTags', 'w:decimalSymbol', 'w:listSeparator')
+
+
+def set_outline_level(style, level: int):
+    """Рівень структури абзаців стилю (0 - перший рівень змісту)"""
+    p_pr = style.element.get_or_add_pPr()
+    for old in p_pr.findall(qn('w:outlineLvl')):
+        p_pr.remove(old)
+    p_pr.insert_element_before(parse_xml(f'<w:outlineLvl {nsdecls("w")} w:val="{level}"/>'),
+                               'w:divId', 'w:cnfStyle', 'w:rPr', 'w:sectPr', 'w:pPrChange')
+
+
+def update_fields_on_open(document):
+    """Оновлення полів (змісту) під час відкриття документа у Word"""
+    settings = document.settings.element
+    if settings.find(qn('w:updateFields')) is None:
+        settings.insert_element_before(parse_xml(f'<w:updateFields {nsdecls("w")} w:val="true"/>'),
+                                       *_settings_after_update)
+
+
+def add_toc(document, levels='1-1', placeholder='Зміст буде сформовано після оновлення полів (F9)', style=None):
+    """
+    Додавання поля змісту (TOC) до документа
+
+    :param levels: рівні структури, що включаються до змісту (\\o "1-1")
+    :param placeholder: текст поля до його оновлення у Word
+    :param style: стиль абзацу поля
+    """
+    paragraph = document.add_paragraph(style=style)
+    paragraph._p.append(parse_xml(
+        f'<w:r {nsdecls("w")}><w:fldChar w:fldCharType="begin" w:dirty="true"/></w:r>'))
+    paragraph._p.append(parse_xml(
+        f'<w:r {nsdecls("w")}><w:instrText xml:space="preserve"> TOC \\o "{levels}" \\h \\z \\u </w:instrText></w:r>'))
+    paragraph._p.append(parse_xml(f'<w:r {nsdecls("w")}><w:fldChar w:fldCharType="separate"/></w:r>'))
+    paragraph._p.append(parse_xml(f'<w:r {nsdecls("w")}><w:t>{escape(placeholder)}</w:t></w:r>'))
+    paragraph._p.append(parse_xml(f'<w:r {nsdecls("w")}><w:fldChar w:fldCharType="end"/></w:r>'))
+    update_fields_on_open(document)
+    return paragraph
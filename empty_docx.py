@@ -1,21 +1,122 @@
+"""
+Базовий документ звітів Word (python-docx):
+    - поля сторінки та стилі звітів налаштовуються один раз у процесі - підготовлений документ зберігається
+      як набір частин пакета (розібрані XML та вміст інших частин)
+    - кожен новий звіт - копія частин підготовленого документа (копіювання дерев XML замість повторного
+      читання шаблону та налаштування стилів)
+    - замість типового документа python-docx може використовуватись шаблон організації (.docx): його стилі,
+      поля та колонтитули зберігаються, відсутні стилі звітів додаються (визначення вбудованих стилів списків
+      та таблиці копіюються з типового документа python-docx разом з нумерацією списків)
+"""
+
+import copy
 from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
 import pandas as pd
 from docx import Document
 from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import XmlPart
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.package import Package
+from docx.parts.numbering import NumberingPart
 from docx.shared import Pt, RGBColor, Cm
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 
+from docx_package import save_document
+from docx_toc import set_outline_level
 
-class _DocEditorEmpty:
+
+def _numbering(document):
+    """Елемент нумерації документа (частина numbering.xml додається, якщо її немає у шаблоні)"""
+    try:
+        return document.part.part_related_by(RT.NUMBERING).element
+    except KeyError:
+        part = NumberingPart(PackURI('/word/numbering.xml'), CT.WML_NUMBERING,
+                             parse_xml(f'<w:numbering {nsdecls("w")}/>'), document.part.package)
+        document.part.relate_to(part, RT.NUMBERING)
+        return part.element
+
+
+def _copy_numbering(document, source, num_id: str) -> str:
     """
-    Клас, що містить інстанс порожнього документу (python-docx) з типовими налаштуваннями та методами
+    Копіювання нумерації списку (w:num та її w:abstractNum) з типового документа python-docx
+
+    :param source: типовий документ python-docx
+    :param num_id: ідентифікатор нумерації у типовому документі
+    :return: ідентифікатор копії нумерації у документі
     """
+    source_numbering = source.part.numbering_part.element
+    numbering = _numbering(document)
+    num = next(num for num in source_numbering.findall(qn('w:num')) if num.get(qn('w:numId')) == num_id)
+    abstract_id = num.find(qn('w:abstractNumId')).get(qn('w:val'))
+    abstract = next(abstract for abstract in source_numbering.findall(qn('w:abstractNum'))
+                    if abstract.get(qn('w:abstractNumId')) == abstract_id)
+    new_abstract_id = str(max((int(abstract.get(qn('w:abstractNumId')))
+                               for abstract in numbering.findall(qn('w:abstractNum'))), default=-1) + 1)
+    new_num_id = str(max((int(num.get(qn('w:numId'))) for num in numbering.findall(qn('w:num'))), default=0) + 1)
+    abstract = copy.deepcopy(abstract)
+    abstract.set(qn('w:abstractNumId'), new_abstract_id)
+    numbering.insert_element_before(abstract, 'w:num', 'w:numIdMacAtCleanup')
+    num = copy.deepcopy(num)
+    num.set(qn('w:numId'), new_num_id)
+    num.find(qn('w:abstractNumId')).set(qn('w:val'), new_abstract_id)
+    numbering.insert_element_before(num, 'w:numIdMacAtCleanup')
+    return new_num_id
 
-    def __init__(self):
-        self.document = Document()
-        self.sections = self.document.sections
-        """Розмір полів"""
-        for section in self.sections:
+
+def _copy_style(document, source, style):
+    """
+    Копіювання визначення стилю з типового документа python-docx до стилів документа разом з відсутніми
+    у документі базовим та пов'язаним стилями і нумерацією списку
+
+    :param source: типовий документ python-docx
+    :param style: елемент w:style типового документа
+    """
+    styles = document.styles.element
+    style = copy.deepcopy(style)
+    styles.append(style)
+    for tag in ('w:basedOn', 'w:link'):
+        ref = style.find(qn(tag))
+        if ref is None or styles.get_by_id(ref.get(qn('w:val'))) is not None:
+            continue
+        ref_style = source.styles.element.get_by_id(ref.get(qn('w:val')))
+        if ref_style is not None:
+            _copy_style(document, source, ref_style)
+    for num_id in style.xpath('./w:pPr/w:numPr/w:numId'):
+        num_id.set(qn('w:val'), _copy_numbering(document, source, num_id.get(qn('w:val'))))
+
+
+def _prepare_document(template: Optional[Union[str, Path]] = None):
+    """
+    Документ з полями та стилями звітів
+
+    :param template: шаблон організації (None - типовий документ python-docx)
+    """
+    document = Document(str(template) if template is not None else None)
+    defined = {style.name for style in document.styles} if template is not None else set()
+    source = Document() if template is not None else None  # визначення вбудованих стилів для шаблону
+
+    def builtin_style(name: str):
+        """Вбудований стиль (відсутній у шаблоні організації копіюється з типового документа)"""
+        if template is not None:
+            _copy_style(document, source, source.styles[name].element)
+        return document.styles[name]
+
+    def report_style(name: str, builtin=False):
+        """Стиль для налаштування (None - стиль визначено шаблоном організації)"""
+        if name in defined:
+            return None
+        if builtin:
+            return builtin_style(name)
+        return document.styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+
+    """Розмір полів"""
+    if template is None:
+        for section in document.sections:
             section.page_height = Cm(29.7)
             section.page_width = Cm(21.0)
             section.top_margin = Cm(2)
@@ -23,10 +124,10 @@ class _DocEditorEmpty:
             section.right_margin = Cm(1)
             section.bottom_margin = Cm(2)
 
-        """Стилі тексту"""
-        self.styles = self.document.styles
-        # Стиль - заголовок "по центру":
-        header_c = self.styles.add_style('central_header', WD_STYLE_TYPE.PARAGRAPH)
+    """Стилі тексту"""
+    # Стиль - заголовок "по центру":
+    header_c = report_style('central_header')
+    if header_c is not None:
         header_c.font.name = 'Times New Roman'
         header_c.font.size = Pt(14)
         header_c.font.bold = True
@@ -34,8 +135,15 @@ class _DocEditorEmpty:
         header_c.paragraph_format.space_after = Pt(0)
         header_c.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
-        # Стиль - звичайний текст:
-        text_base = self.styles.add_style('text_base', WD_STYLE_TYPE.PARAGRAPH)
+    # Стиль - заголовок звіту особи (як "по центру", перший рівень структури - пункт змісту об'єднаного документа):
+    person_header = report_style('person_header')
+    if person_header is not None:
+        person_header.base_style = document.styles['central_header']
+        set_outline_level(person_header, 0)
+
+    # Стиль - звичайний текст:
+    text_base = report_style('text_base')
+    if text_base is not None:
         text_base.font.name = 'Times New Roman'
         text_base.font.size = Pt(14)
         text_base.paragraph_format.space_before = Pt(0)
@@ -44,8 +152,9 @@ class _DocEditorEmpty:
         text_base.paragraph_format.first_line_indent = Cm(1.25)
         text_base.paragraph_format.line_spacing = 1
 
-        # Стиль - темно-червоний текст:
-        text_red = self.styles.add_style('text_red', WD_STYLE_TYPE.PARAGRAPH)
+    # Стиль - темно-червоний текст:
+    text_red = report_style('text_red')
+    if text_red is not None:
         text_red.font.name = 'Times New Roman'
         text_red.font.size = Pt(14)
         text_red.font.color.rgb = RGBColor(127, 12, 7)
@@ -55,8 +164,9 @@ class _DocEditorEmpty:
         text_red.paragraph_format.first_line_indent = Cm(1.25)
         text_red.paragraph_format.line_spacing = 1
 
-        # Дефолтний стиль - ненумерований список:
-        list_style = self.styles['List Bullet']
+    # Дефолтний стиль - ненумерований список:
+    list_style = report_style('List Bullet', builtin=True)
+    if list_style is not None:
         list_style.font.name = 'Times New Roman'
         list_style.font.size = Pt(14)
         list_style.paragraph_format.space_before = Pt(0)
@@ -66,8 +176,9 @@ class _DocEditorEmpty:
         list_style.paragraph_format.left_indent = Cm(0.63)
         list_style.paragraph_format.line_spacing = 1
 
-        # Дефолтний стиль - ненумерований список другого порядку:
-        list_style = self.styles['List Bullet 2']
+    # Дефолтний стиль - ненумерований список другого порядку:
+    list_style = report_style('List Bullet 2', builtin=True)
+    if list_style is not None:
         list_style.font.name = 'Times New Roman'
         list_style.font.size = Pt(14)
         list_style.paragraph_format.space_before = Pt(0)
@@ -77,9 +188,79 @@ class _DocEditorEmpty:
         list_style.paragraph_format.left_indent = Cm(2.5)
         list_style.paragraph_format.line_spacing = 1
 
-        tab_style = self.styles['Table Grid']
+    if 'Table Grid' not in defined:
+        tab_style = builtin_style('Table Grid')
         tab_style.font.name = 'Times New Roman'
         tab_style.font.size = Pt(9)
+    return document
+
+
+class _PreparedPackage:
+    """
+    Частини пакета підготовленого документа: XML частини зберігаються розібраними (копіюються deepcopy),
+    інші частини - вмістом (bytes, спільний для копій)
+    """
+
+    def __init__(self, document):
+        package = document.part.package
+        self.parts = list(package.iter_parts())
+        self.package_rels = list(package.rels.values())
+
+    def clone(self):
+        """Новий документ python-docx - копія підготовленого документа"""
+        package = Package()
+        copies = {}
+        for part in self.parts:
+            if isinstance(part, XmlPart):
+                copies[part] = type(part)(part.partname, part.content_type, copy.deepcopy(part.element), package)
+            else:
+                copies[part] = type(part).load(part.partname, part.content_type, part.blob, package)
+        for part in self.parts:
+            for rel in part.rels.values():
+                target = rel.target_ref if rel.is_external else copies[rel.target_part]
+                copies[part].load_rel(rel.reltype, target, rel.rId, rel.is_external)
+        for rel in self.package_rels:
+            target = rel.target_ref if rel.is_external else copies[rel.target_part]
+            package.load_rel(rel.reltype, target, rel.rId, rel.is_external)
+        for part in copies.values():
+            part.after_unmarshal()
+        package.after_unmarshal()
+        return package.main_document_part.document
+
+
+# Підготовлені документи процесу {шлях шаблону: (час зміни та розмір файлу шаблону, частини пакета)}:
+_prepared: Dict[str, Tuple[tuple, _PreparedPackage]] = {}
+
+
+def new_document(template: Optional[Union[str, Path]] = None):
+    """
+    Новий документ звіту: копія документа з полями та стилями звітів, підготовленого один раз у процесі
+
+    :param template: шаблон організації (.docx, None - типовий документ python-docx)
+    """
+    key, version = '', ()
+    if template is not None:
+        path = Path(template).resolve()
+        stat = path.stat()
+        key, version = str(path), (stat.st_mtime_ns, stat.st_size)  # змінений шаблон готується повторно
+    if key not in _prepared or _prepared[key][0] != version:
+        _prepared[key] = (version, _PreparedPackage(_prepare_document(template)))
+    return _prepared[key][1].clone()
+
+
+class _DocEditorEmpty:
+    """
+    Клас, що містить інстанс порожнього документу (python-docx) з типовими налаштуваннями та методами
+    """
+
+    def __init__(self, template: Optional[Union[str, Path]] = None, document=None):
+        """
+        :param template: шаблон організації (.docx, None - типовий документ python-docx)
+        :param document: наявний документ звітів (new_document), до якого додається вміст (None - новий документ)
+        """
+        self.document = document if document is not None else new_document(template)
+        self.sections = self.document.sections
+        self.styles = self.document.styles
 
     # def add_tab(self, df: pd.DataFrame):
     #     """Підготовка та додавання таблиці у документ"""
@@ -116,12 +297,12 @@ class _DocEditorEmpty:
     #     self.document.add_paragraph(style='text_base')
 
     def save_docx(self, file_path):
-        """Збереження документу python-docx у файл MS Word"""
+        """Збереження документу python-docx у файл MS Word (разом з рядками потокових таблиць)"""
         if type(file_path) == str:
             file_path = Path(file_path)
             file_path = file_path.with_suffix('.docx')
         try:
-            self.document.save(file_path.absolute())
+            save_document(self.document, file_path.absolute())
             return True
         except Exception:
             return False
\ No newline at end of file
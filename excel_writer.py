@@ -0,0 +1,163 @@
+"""
+Потоковий запис книг Excel (openpyxl, режим write-only):
+    - рядки записуються у файл по мірі формування, без побудови повної об'єктної моделі книги
+    - датафрейми (у т.ч. зведені таблиці з MultiIndex) передаються частинами
+    - суми зберігаються числами з форматом Excel (розділювач тисяч, два знаки після коми)
+    - аркуш може складатись з декількох послідовно записаних розділів (таблиць), посилання між аркушами -
+      формули HYPERLINK
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Union
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+sum_format = '#,##0.00'  # формат сум: 1 200 000.00 (розділювачі - відповідно до локалі Excel)
+sheet_name_limit = 31  # максимальна довжина назви аркуша Excel
+sheet_rows_limit = 1048576  # максимальна кількість рядків аркуша Excel (разом з заголовком)
+
+
+def sheet_title(name: str) -> str:
+    """Допустима назва аркуша: без символів []:*?/\\ та не довша за 31 символ"""
+    return re.sub(r'[\[\]:*?/\\]', '_', str(name))[:sheet_name_limit]
+
+
+def sheet_link(sheet_name: str, text: str, cell='A1') -> str:
+    """Формула посилання на клітинку іншого аркуша книги"""
+    sheet_name = sheet_name.replace("'", "''")
+    text = str(text).replace('"', '""')
+    return f'=HYPERLINK("#\'{sheet_name}\'!{cell}","{text}")'
+
+
+def apply_number_format(sheet, columns: Iterable[int], fmt=sum_format):
+    """
+    Формат чисел для колонок аркуша звичайної книги openpyxl: формат колонки та наявних клітинок
+    (значення залишаються числами, придатними до обчислень)
+
+    :param sheet: аркуш openpyxl
+    :param columns: номери колонок (з 1)
+    :param fmt: числовий формат Excel
+    """
+    for col in columns:
+        sheet.column_dimensions[get_column_letter(col)].number_format = fmt
+        for (cell,) in sheet.iter_rows(min_col=col, max_col=col):
+            cell.number_format = fmt
+
+
+def frame_rows(df: pd.DataFrame, index=False, header=True, chunk_size=10000) -> Iterator[List]:
+    """
+    Рядки датафрейму для запису у аркуш: заголовки (по рядку на кожен рівень MultiIndex колонок, назви
+    рівнів індексу - в останньому рядку заголовків) та значення (NaN - порожня клітинка)
+
+    :param df: датафрейм
+    :param index: записувати індекс (колонками ліворуч)
+    :param header: записувати заголовки
+    :param chunk_size: кількість рядків, що перетворюються за один раз
+    """
+    idx = df.index.to_frame(index=False) if index else None
+    if header:
+        levels = df.columns.nlevels
+        for level in range(levels):
+            row = []
+            if idx is not None and level == levels - 1:
+                row += ['' if name is None else str(name) for name in idx.columns]
+            elif idx is not None:
+                row += [''] * idx.shape[1]
+            row += [col[level] if levels > 1 else col for col in df.columns]
+            yield row
+
+    for start in range(0, df.shape[0], chunk_size):
+        values = df.iloc[start:start + chunk_size].to_numpy(dtype=object)
+        if idx is not None:
+            values = np.hstack([idx.iloc[start:start + chunk_size].to_numpy(dtype=object), values])
+        values[pd.isna(values)] = None
+        yield from values.tolist()
+
+
+class StreamWorkbook:
+    """
+    Книга Excel у режимі write-only: кожен аркуш записується одразу (рядок за рядком), пам'ять не залежить
+    від кількості рядків
+    """
+
+    def __init__(self, file: Union[str, Path]):
+        self.file = file
+        self.book = Workbook(write_only=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.save()
+
+    def create_sheet(self, sheet_name: str, number_formats: Dict[int, str] = None):
+        """
+        Створення аркуша (рядки додаються append_rows/append_frame)
+
+        :param number_formats: числові формати колонок {номер колонки (з 1): формат Excel}
+        """
+        sheet = self.book.create_sheet(sheet_name)
+        for col, fmt in (number_formats or {}).items():
+            sheet.column_dimensions[get_column_letter(col)].number_format = fmt
+        return sheet
+
+    @staticmethod
+    def append_rows(sheet, rows: Iterable[List], number_formats: Dict[int, str] = None):
+        """
+        Послідовний запис рядків у створений аркуш
+
+        :param number_formats: числові формати клітинок {номер колонки (з 1): формат Excel} (лише для чисел)
+        """
+        if not number_formats:
+            for row in rows:
+                sheet.append(row)
+            return
+
+        positions = [(col - 1, fmt) for col, fmt in number_formats.items()]
+        for row in rows:
+            for pos, fmt in positions:
+                if pos < len(row) and isinstance(row[pos], (int, float, np.number)):
+                    cell = WriteOnlyCell(sheet, row[pos])
+                    cell.number_format = fmt
+                    row[pos] = cell
+            sheet.append(row)
+
+    @staticmethod
+    def frame_formats(df: pd.DataFrame, index=False, number_format: str = None) -> Dict[int, str]:
+        """Числові формати колонок значень датафрейму (колонки індексу - без формату)"""
+        if not number_format:
+            return {}
+        first = df.index.nlevels + 1 if index else 1
+        return {col: number_format for col in range(first, first + df.shape[1])}
+
+    def append_frame(self, sheet, df: pd.DataFrame, index=False, number_format: str = None):
+        """Запис датафрейму розділом створеного аркуша (з поточного рядка)"""
+        self.append_rows(sheet, frame_rows(df, index=index), self.frame_formats(df, index, number_format))
+
+    def write_rows(self, sheet_name: str, rows: Iterable[List], number_formats: Dict[int, str] = None):
+        """
+        Створення аркуша та послідовний запис рядків
+
+        :param number_formats: числові формати колонок {номер колонки (з 1): формат Excel}
+        """
+        sheet = self.create_sheet(sheet_name, number_formats)
+        self.append_rows(sheet, rows, number_formats)
+        return sheet
+
+    def write_frame(self, sheet_name: str, df: pd.DataFrame, index=False, number_format: str = None):
+        """
+        Запис датафрейму на окремий аркуш
+
+        :param number_format: числовий формат для всіх колонок значень (не індексу)
+        """
+        return self.write_rows(sheet_name, frame_rows(df, index=index),
+                               number_formats=self.frame_formats(df, index, number_format))
+
+    def save(self):
+        self.book.save(self.file)
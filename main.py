@@ -19,6 +19,7 @@ https://www.flaticon.com/free-icons/excel - Excel icons created by Bharat Icons
 """
 
 import sys
+import multiprocessing
 from pathlib import Path
 
 from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QMessageBox
@@ -26,6 +27,8 @@ from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QMessageBox
 from gui.main_gui import Ui_MainWindow
 from xml_converter import FileProfitXML
 from word_reporter import DocEditor
+from company_names import save_titles_cache, set_titles_cache
+from charts import set_chart_cache
 
 
 class AppWin(QMainWindow, Ui_MainWindow):
@@ -62,6 +65,7 @@ class AppWin(QMainWindow, Ui_MainWindow):
                 return
 
             warnings = self.data.fill_df()
+            save_titles_cache()  # нові скорочення назв агентів - у файл кешу
             if warnings != '':
                 msg = QMessageBox()
                 msg.setIcon(QMessageBox.Information)
@@ -110,11 +114,22 @@ class AppWin(QMainWindow, Ui_MainWindow):
             self.statusbar.showMessage('Збереження Excel...', 5000)
             QApplication.processEvents()
             self.data: FileProfitXML
-            self.data.save_excel(new_file[0],
-                                 separate=self.rb_excel_sep.isChecked(),
-                                 format_float=self.cb_float_format.isChecked(),
-                                 add_profit_column=self.cb_add_profi_col.isChecked())
-            self.statusbar.showMessage('Запис Excel файлу завершено', 5000)
+            errors = self.data.save_excel(new_file[0],
+                                          separate=self.rb_excel_sep.isChecked(),
+                                          format_float=self.cb_float_format.isChecked(),
+                                          add_profit_column=self.cb_add_profi_col.isChecked(),
+                                          workers=None)  # файли осіб - пулом процесів (кількість ядер)
+            if errors:
+                msg = QMessageBox()
+                msg.setIcon(QMessageBox.Warning)
+                msg.setText("Не всі файли Excel збережено.")
+                msg.setInformativeText(errors)
+                msg.setWindowTitle("Помилка запису Excel")
+                msg.setStandardButtons(QMessageBox.Ok)
+                msg.exec_()
+                self.statusbar.showMessage('Запис Excel файлів завершено з помилками', 5000)
+            else:
+                self.statusbar.showMessage('Запис Excel файлу завершено', 5000)
 
     def save_word(self):
         self.statusbar.showMessage('Збереження Word...', 5000)
@@ -124,11 +139,29 @@ class AppWin(QMainWindow, Ui_MainWindow):
                                  add_signs=self.cb_det_types.isChecked(),
                                  add_tab=self.cb_det_tab.isChecked(),
                                  sub_list_text=self.rb_sublist_text.isChecked(),
-                                 sub_list_table=self.rb_sublist_table.isChecked())
-        self.statusbar.showMessage('Запис Word файлу завершено', 5000)
+                                 sub_list_table=self.rb_sublist_table.isChecked(),
+                                 workers=None,  # звіти осіб - пулом процесів (кількість ядер)
+                                 progress=self._word_progress)
+        if word_doc.errors:
+            msg = QMessageBox()
+            msg.setIcon(QMessageBox.Warning)
+            msg.setText("Не всі звіти Word сформовано.")
+            msg.setInformativeText(''.join(f'{p}: {e}\n' for p, e in word_doc.errors.items()))
+            msg.setWindowTitle("Помилка запису Word")
+            msg.setStandardButtons(QMessageBox.Ok)
+            msg.exec_()
+            self.statusbar.showMessage('Запис Word файлів завершено з помилками', 5000)
+        else:
+            self.statusbar.showMessage('Запис Word файлу завершено', 5000)
+
+    def _word_progress(self, done: int, total: int):
+        self.statusbar.showMessage(f'Збереження Word... {done} з {total}', 5000)
+        QApplication.processEvents()
 
 
 def run_gui():
+    set_titles_cache(Path.home() / '.skarb' / 'company_titles.json')  # кеш скорочень назв агентів між запусками
+    set_chart_cache(Path.home() / '.skarb' / 'charts')  # кеш зображень графіків звітів Word між запусками
     app = QApplication(sys.argv)
     app.setApplicationName("Skarb - profit converter")
     window = AppWin()
@@ -137,6 +170,7 @@ def run_gui():
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # пули процесів запису Excel та формування звітів Word у зібраному exe
     run_gui()
 """
 Для заміни у генерованому файлі інтерфейсу:
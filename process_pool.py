@@ -0,0 +1,51 @@
+"""
+Обмежений пул процесів для пакетних завдань (файли Excel та звіти Word осіб, зведення файлів XML):
+    - вхідні дані завдання готуються безпосередньо перед його подачею, одночасно в обробці не більше
+      max_pending завдань (дані решти завдань не накопичуються у пам'яті)
+    - першими можуть подаватись найбільші завдання (найдовші завдання не залишаються на кінець)
+    - результати та помилки завдань передаються функціям обробки у порядку завершення
+"""
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Iterable, Optional
+
+
+def run_bounded(func: Callable, items: Iterable, task_args: Callable[[Any], tuple],
+                on_result: Callable[[Any, Any], None], on_error: Callable[[Any, Exception], None],
+                workers: int, max_pending: Optional[int] = None, size: Optional[Callable[[Any], int]] = None,
+                initializer: Optional[Callable] = None, initargs: tuple = ()):
+    """
+    Виконання завдань пулом процесів з обмеженням кількості завдань в обробці
+
+    :param func: функція завдання (виконується у процесі пулу)
+    :param items: елементи завдань (особи, пакети файлів)
+    :param task_args: task_args(елемент) - аргументи функції завдання елемента
+    :param on_result: on_result(елемент, результат завдання)
+    :param on_error: on_error(елемент, виняток завдання)
+    :param workers: кількість процесів
+    :param max_pending: максимальна кількість завдань в обробці одночасно (None - workers * 2)
+    :param size: size(елемент) - розмір завдання, першими подаються найбільші (None - у порядку items)
+    :param initializer: функція ініціалізації процесів пулу (з аргументами initargs)
+    """
+    if size is not None:
+        items = sorted(items, key=size, reverse=True)
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        queue = iter(items)
+        pending = {}
+        while True:
+            for item in queue:
+                pending[pool.submit(func, *task_args(item))] = item
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    on_error(item, e)
+                else:
+                    on_result(item, result)
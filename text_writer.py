@@ -0,0 +1,120 @@
+"""
+Потоковий запис датафреймів у текстові формати для завантажувачів даних:
+    - CSV та NDJSON (JSON lines - один об'єкт JSON на рядок)
+    - дані передаються частинами (ітератором датафреймів) і дописуються у відкритий файл
+    - кожне унікальне значення колонки перетворюється на текст один раз (коди платників, агентів, назви
+      повторюються у тисячах записів), рядки файлу збираються з готових фрагментів
+    - за потреби файл стискається gzip під час запису (без тимчасових файлів)
+"""
+
+import gzip
+import json
+from pathlib import Path
+from typing import IO, Callable, Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+
+
+def open_text(file: Union[str, Path], encoding='utf-8', compress: bool = None, compresslevel=6) -> IO:
+    """
+    Відкриття текстового файлу для запису
+
+    :param compress: стиснення gzip (None - за розширенням файлу .gz)
+    :param compresslevel: рівень стиснення gzip (1 - найшвидше, 9 - найменший розмір)
+    """
+    if compress is None:
+        compress = Path(file).suffix.lower() == '.gz'
+    if compress:
+        return gzip.open(file, 'wt', encoding=encoding, newline='', compresslevel=compresslevel)
+    return open(file, 'w', encoding=encoding, newline='')
+
+
+def column_text(column: pd.Series, to_text: Callable, na_text='') -> List[str]:
+    """
+    Текстові значення колонки: перетворення виконується лише для унікальних значень
+
+    :param to_text: функція перетворення одного значення
+    :param na_text: текст відсутнього значення
+    """
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    texts = np.array([to_text(value) for value in uniques] + [na_text], dtype=object)
+    return texts[codes].tolist()  # код -1 (відсутнє значення) - останній елемент
+
+
+def csv_value(value, delimiter=',', decimals=2) -> str:
+    """Значення клітинки CSV (лапки - лише за наявності розділювача, лапок або перенесення рядка)"""
+    if isinstance(value, (float, np.floating)):
+        return f'{value:.{decimals}f}'
+    value = str(value)
+    if delimiter in value or '"' in value or '\n' in value or '\r' in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def json_value(value, decimals=2) -> str:
+    """Значення JSON: числа - як є (дробові - з decimals знаками, нескінченні та NaN - null), інше - рядок"""
+    if isinstance(value, (bool, np.bool_)):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, np.integer)):
+        return str(value)
+    if isinstance(value, (float, np.floating)):
+        return f'{value:.{decimals}f}' if np.isfinite(value) else 'null'
+    return json.dumps(str(value), ensure_ascii=False)
+
+
+def csv_lines(df: pd.DataFrame, delimiter=',', decimals=2) -> str:
+    """Рядки CSV датафрейму (без заголовку)"""
+    if df.shape[0] == 0:
+        return ''
+    columns = [column_text(df[col], lambda v: csv_value(v, delimiter, decimals)) for col in df.columns]
+    return '\n'.join(map(delimiter.join, zip(*columns))) + '\n'
+
+
+def ndjson_lines(df: pd.DataFrame, decimals=2) -> str:
+    """Рядки NDJSON датафрейму: ключ кожної колонки та дужки об'єкту додаються до унікальних значень"""
+    if df.shape[0] == 0:
+        return ''
+    columns = []
+    last = df.shape[1] - 1
+    for n, col in enumerate(df.columns):
+        prefix = ('{' if n == 0 else '') + json.dumps(str(col), ensure_ascii=False) + ':'
+        suffix = '}' if n == last else ''
+        columns.append(column_text(df[col], lambda v: prefix + json_value(v, decimals) + suffix,
+                                   na_text=prefix + 'null' + suffix))
+    return '\n'.join(map(','.join, zip(*columns))) + '\n'
+
+
+def write_csv(chunks: Iterable[pd.DataFrame], file: Union[str, Path], encoding='utf-8', delimiter=',',
+              compress: bool = None, compresslevel=6, decimals=2) -> int:
+    """
+    Запис частин датафрейму у файл CSV (заголовок - з першої частини)
+
+    :param chunks: частини датафрейму з однаковими колонками
+    :param decimals: кількість знаків після коми дробових чисел
+    :return: кількість записаних рядків
+    """
+    rows = 0
+    with open_text(file, encoding, compress, compresslevel) as f:
+        for chunk in chunks:
+            if rows == 0:
+                f.write(delimiter.join(csv_value(col, delimiter) for col in chunk.columns) + '\n')
+            f.write(csv_lines(chunk, delimiter, decimals))
+            rows += chunk.shape[0]
+    return rows
+
+
+def write_ndjson(chunks: Iterable[pd.DataFrame], file: Union[str, Path], encoding='utf-8',
+                 compress: bool = None, compresslevel=6, decimals=2) -> int:
+    """
+    Запис частин датафрейму у файл NDJSON (рядок - об'єкт {колонка: значення}, відсутні значення - null)
+
+    :param decimals: кількість знаків після коми дробових чисел
+    :return: кількість записаних рядків
+    """
+    rows = 0
+    with open_text(file, encoding, compress, compresslevel) as f:
+        for chunk in chunks:
+            f.write(ndjson_lines(chunk, decimals))
+            rows += chunk.shape[0]
+    return rows
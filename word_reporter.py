@@ -2,8 +2,12 @@
 Формування документу MS Word
 """
 import io
+import json
+import os
 import re
-from typing import List
+from pathlib import Path
+from typing import IO, Callable, List, Optional, Union
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
 
 import pandas as pd
 import numpy as np
@@ -11,17 +15,24 @@ import numpy as np
 from docx import Document
 from docx.shared import Cm
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from docx.enum.table import WD_CELL_VERTICAL_ALIGNMENT
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
+from docx.enum.table import WD_TABLE_ALIGNMENT
 
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import Figure
+from docx.oxml.ns import qn
 
-from empty_docx import _DocEditorEmpty
+from empty_docx import _DocEditorEmpty, new_document
+from charts import bar_chart, chart_cache, legend_table, pie_chart, set_chart_cache
+from docx_tables import CellFormat, add_grid_table, add_streamed_table, header_fill, vertical_merges
+from docx_charts import add_bar_chart, add_picture, add_pie_chart
+from docx_package import save_document
+from docx_toc import add_toc
+from process_pool import run_bounded
 from xml_converter import FileProfitXML
+from company_names import company_title
+
+from defines import dict_long, dict_short, service_col_names, headersdict
 
-from defines import dict_long, dict_short, service_col_names, headersdict, dict_company_types
+# Назви колонок, що використовуються у коді, та відповідні колонки датафрейму FileProfitXML (без перейменування):
+cols = {name: column for column, name in service_col_names.items()}
 
 
 class DocEditor():
@@ -35,29 +46,154 @@ class DocEditor():
                  add_signs=False,
                  add_tab=False,
                  sub_list_text=None,
-                 sub_list_table=None):
+                 sub_list_table=None,
+                 workers: int = 1,
+                 progress: Callable[[int, int], None] = None,
+                 native_charts=False,
+                 compresslevel=6,
+                 template: Union[str, Path, None] = None,
+                 single_file: Union[str, Path, IO, None] = None,
+                 stream_rows: Optional[int] = 5000,
+                 in_memory=False,
+                 bundle: Union[str, Path, IO, None] = None):
+        """
+        :param native_charts: діаграми Word з даними, що редагуються (замість зображень matplotlib)
+        :param compresslevel: рівень стиснення файлів .docx (1 - найшвидше, 9 - найменший розмір)
+        :param template: шаблон документа організації (.docx, None - типові поля та стилі звітів)
+        :param single_file: файл (шлях або файловий об'єкт) об'єднаного документа звітів всіх осіб (None - окремий
+            файл кожної особи); об'єднаний документ формується у поточному процесі (workers не використовується)
+        :param stream_rows: кількість записів особи, з якої рядки деталізованої таблиці записуються у файл під час
+            збереження, без побудови дерева XML таблиці (None - таблиця завжди будується у документі)
+        :param in_memory: звіти осіб зберігаються у пам'яті (reports) замість файлів "<РНОКПП>.docx"
+        :param bundle: zip-архів (шлях або файловий об'єкт), до якого записуються звіти осіб в міру формування та
+            перелік звітів manifest.json (РНОКПП, файл, період, кількість записів, суми) - без файлів звітів
+        :param workers: кількість процесів формування звітів (1 - у поточному процесі, None - кількість ядер)
+        :param progress: функція progress(сформовано_звітів, всього_звітів)
+        """
         self.xml_inst = xml_inst  # посилання на результати опрацювання XML
-        self.df_xml = xml_inst.df.copy()
-        self.df_xml.rename(columns=service_col_names, inplace=True)  # назви колонок до більш зручних у коді
+        self.df_xml = xml_inst.df  # спільний датафрейм (без копіювання), звернення до колонок - через cols
+        self.employers = xml_inst.employers  # довідник агентів: код - назва, скорочена назва, період, кількість
+        self.errors = {}  # помилки формування звітів {РНОКПП: текст помилки}
+        self.done = []  # особи, звіти яких збережено
+        self.reports = {}  # звіти осіб у пам'яті (in_memory) {РНОКПП: вміст .docx}
+        self.manifest = []  # підсумки сформованих звітів (DocPartPerson.summary) у порядку формування
+
+        # Визначення переліку осіб щодо яких наявні записи у завантаженому XML:
+        self.persons = [x for x in self.df_xml[cols['person']].dropna().unique().tolist() if len(x) > 6]
+        options = dict(add_years=add_years, add_signs=add_signs, add_tab=add_tab,
+                       sub_list_text=sub_list_text, sub_list_table=sub_list_table, native_charts=native_charts,
+                       compresslevel=compresslevel, template=template, stream_rows=stream_rows,
+                       in_memory=in_memory or bundle is not None)
+        bundle_zip = ZipFile(bundle, 'w', compression=ZIP_DEFLATED) if bundle is not None else None
+
+        def collect(person, error=None, report=None):
+            """
+            :param report: результат формування звіту (вміст .docx або None - звіт збережено у файл, підсумки звіту)
+            """
+            if error is None:
+                blob, summary = report
+                if bundle_zip is not None and blob is not None:
+                    bundle_zip.writestr(summary['file'], blob, compress_type=ZIP_STORED)  # .docx - вже стиснений
+                if in_memory and blob is not None:
+                    self.reports[person] = blob
+                self.manifest.append(summary)
+                self.done.append(person)
+            else:
+                self.errors[person] = error
+            if progress is not None:
+                progress(len(self.done) + len(self.errors), len(self.persons))
 
-        # Формування додаткової колонки для сортування з урахуванням кварталу:
-        def create_quad_col(row):
-            return int(row['year']) * 10 + int(row['quad'])
+        try:
+            if single_file is not None:
+                self._run_single(options, single_file, collect)
+            elif workers == 1:
+                for p in self.persons:  # виклик DocPartPerson який додає всі звіти в ОКРЕМІ ФАЙЛИ файл (self.document)
+                    try:
+                        part = DocPartPerson(self, p, **options)
+                    except Exception as e:
+                        collect(p, str(e))
+                    else:
+                        collect(p, report=(part.blob, part.summary()))
+            else:
+                self._run_parallel(options, workers or os.cpu_count() or 1, collect)
+        finally:
+            if bundle_zip is not None:
+                bundle_zip.writestr('manifest.json', json.dumps({'reports': self.manifest, 'errors': self.errors},
+                                                                ensure_ascii=False, indent=1))
+                bundle_zip.close()
+
+    def _run_parallel(self, options: dict, workers: int, collect: Callable):
+        """
+        Формування звітів осіб пулом процесів: кожне завдання отримує лише записи особи та відповідних агентів,
+        першими подаються особи з найбільшою кількістю записів (найдовші завдання), одночасно в обробці не більше
+        workers * 2 завдань
+        """
+        rows = self.xml_inst.person_rows()
+
+        def task_args(p):
+            df = self.xml_inst.person_df(p)
+            employers = self.employers.loc[self.employers.index.isin(df[cols['employer_id']].dropna())]
+            return df, employers, p, options
+
+        # Каталог кешу графіків передається процесам пулу (кеш у пам'яті - окремий у кожному процесі):
+        run_bounded(_person_report, self.persons, task_args, lambda p, report: collect(p, report=report),
+                    lambda p, e: collect(p, str(e)), workers, size=lambda p: len(rows[p]),
+                    initializer=set_chart_cache, initargs=(chart_cache.directory, chart_cache.max_bytes))
+
+    def _run_single(self, options: dict, file: Union[str, Path, IO], collect: Callable):
+        """
+        Формування звітів всіх осіб в одному документі: зміст (пункти - заголовки звітів осіб), звіт кожної особи -
+        з нової сторінки; стилі та однакові зображення спільні, документ зберігається один раз. Вміст звіту,
+        формування якого завершилось помилкою, вилучається з документа разом з доданими ним відношеннями
+        (частинами діаграм та зображень). Звіти осіб окремо не зберігаються
+        (in_memory та bundle - лише перелік звітів).
+        """
+        document = new_document(options['template'])
+        document.add_paragraph('Зміст', style='central_header')
+        add_toc(document)
+        body = document.element.body
+
+        def content_end():  # позиція після останнього елемента вмісту (перед параметрами розділу w:sectPr)
+            return len(body) - (body[-1].tag == qn('w:sectPr'))
+
+        for p in self.persons:
+            start = content_end()
+            r_ids = set(document.part.rels)
+            try:
+                document.add_page_break()
+                part = DocPartPerson(self, p, document=document, **options)
+            except Exception as e:
+                for element in body[start:content_end()]:
+                    body.remove(element)
+                for r_id in set(document.part.rels) - r_ids:
+                    document.part.drop_rel(r_id)
+                collect(p, str(e))
+            else:
+                collect(p, report=(None, part.summary()))
+        try:
+            save_document(document, file, options['compresslevel'])
+        except Exception as e:
+            self.errors.update({p: str(e) for p in self.done})
+            self.done.clear()
+            self.manifest.clear()
 
-        self.df_xml['year_quad'] = self.df_xml.apply(lambda row: create_quad_col(row), axis=1)
 
-        # Визначення переліку осіб щодо яких наявні записи у завантаженому XML:
-        self.persons = [x for x in self.df_xml['person'].dropna().unique().tolist() if len(x) > 6]
-        for p in self.persons:  # виклик DocPartPerson який додає всі звіти в ОКРЕМІ ФАЙЛИ файл (self.document)
-            DocPartPerson(self, p,
-                          add_years=add_years, add_signs=add_signs, add_tab=add_tab,
-                          sub_list_text=sub_list_text, sub_list_table=sub_list_table)
+def _person_report(df: pd.DataFrame, employers: pd.DataFrame, person, options: dict):
+    """
+    Формування звіту однієї особи в окремому процесі (записи особи та довідник її агентів)
+
+    :return: вміст .docx (in_memory, інакше None - звіт збережено у файл) та підсумки звіту
+    """
+    editor = DocEditor(FileProfitXML.from_df(df, employers=employers), workers=1, **options)
+    if editor.errors:
+        raise RuntimeError(editor.errors[person])
+    return editor.reports.get(person), editor.manifest[0]
+
 
 class DocPartPerson(_DocEditorEmpty):
     """
     Клас формування частини документу, що стосується окремої особи.
     """
-    h_pers = ['year', 'quad', 'employer_id', 'employer_name', 'income', 'tax', 'desc']
 
     def __init__(self,
                  editor: DocEditor,
@@ -66,18 +202,32 @@ class DocPartPerson(_DocEditorEmpty):
                  add_signs=False,
                  add_tab=True,
                  sub_list_text=None,
-                 sub_list_table=None):
-        super().__init__()
+                 sub_list_table=None,
+                 native_charts=False,
+                 compresslevel=6,
+                 template: Union[str, Path, None] = None,
+                 stream_rows: Optional[int] = 5000,
+                 in_memory=False,
+                 document: Document = None):
+        """
+        :param in_memory: звіт зберігається у пам'яті (blob) замість файлу "<РНОКПП>.docx"
+        :param document: об'єднаний документ, до якого додається звіт особи (None - окремий файл "<РНОКПП>.docx")
+        """
+        super().__init__(template, document)
+        self.combined = document is not None
+        self.blob: Optional[bytes] = None  # вміст .docx (in_memory)
         self.sub_list_text = sub_list_text
         self.sub_list_table = sub_list_table
+        self.native_charts = native_charts
+        self.stream_rows = stream_rows
         self.editor: DocEditor = editor
         self.person = person
-        self.df: pd.DataFrame = editor.df_xml.loc[editor.df_xml['person'] == person].copy()
+        self.df: pd.DataFrame = editor.xml_inst.person_df(person)  # зріз спільного датафрейму (лише читання)
         # self.df.replace({'desc': self.editor.xml_inst.signs}, inplace=True)
         self.min_quad = self.df['year_quad'].min()
         self.max_quad = self.df['year_quad'].max()
-        self.min_year = self.df['year'].min()
-        self.max_year = self.df['year'].max()
+        self.min_year = self.df[cols['year']].min()
+        self.max_year = self.df[cols['year']].max()
         assert self.max_year >= self.min_year
 
         # Визначення тривалості періоду за який наявні дані (щодо опрацьованої особи):
@@ -92,7 +242,7 @@ class DocPartPerson(_DocEditorEmpty):
         self.dur_month = self.dur_month * 3  # квартали в місяці
 
         # Визначення середніх значень доходів (розраховується з прибутку):
-        self.profit_ave_month = round(self.df['profit'].sum() / self.dur_month, 2)
+        self.profit_ave_month = round(self.df[cols['profit']].sum() / self.dur_month, 2)
         self.profit_ave_year = round(self.profit_ave_month * 12, 2)
 
         # Тестове представлення тривалості у місяцях (для використання у документі):
@@ -104,12 +254,11 @@ class DocPartPerson(_DocEditorEmpty):
         # Період у кварталах
         self.quad_count = self.dur_month // 3
 
-        # Словник відповідності: код ЄДРПОУ = назва юридичної особи
-        sources_list = self.df['employer_id'].dropna().unique().tolist()
-        self.sources_dict = {}
-        for s in sources_list:
-            name = self.df.loc[self.df['employer_id'] == s]['employer_name'].unique().tolist()[0]
-            self.sources_dict.update({s: name})
+        # Словники відповідності: код ЄДРПОУ = назва юридичної особи (повна та скорочена) з довідника агентів
+        employer_ids = self.df[cols['employer_id']].dropna().unique()
+        employers = editor.employers.loc[editor.employers.index.isin(employer_ids)]
+        self.sources_dict = employers['name'].to_dict()
+        self.titles_dict = employers['title'].to_dict()
 
         self.quad_dict = {}
         self.years_dict = {}
@@ -130,15 +279,32 @@ class DocPartPerson(_DocEditorEmpty):
         if add_signs:
             self._add_profit_signs()
         if add_tab:
-            self._add_common_table(self.df_format(self.df, self.h_pers))
-        self.document.save(f"{self.person}.docx")
+            self._add_common_table(self.df_format(self.df))
+        if self.combined:
+            return
+        if in_memory:
+            memory_file = io.BytesIO()
+            save_document(self.document, memory_file, compresslevel)
+            self.blob = memory_file.getvalue()
+        else:
+            save_document(self.document, f"{self.person}.docx", compresslevel)
+
+    def summary(self) -> dict:
+        """Підсумки звіту особи (перелік звітів DocEditor.manifest)"""
+        return {'person': str(self.person),
+                'file': f'{self.person}.docx',
+                'period': f'{str(self.min_quad)[-1]}кв. {self.min_year} - {str(self.max_quad)[-1]}кв. {self.max_year}',
+                'records': int(len(self.df)),
+                'income': round(float(self.df[cols['income']].sum()), 2),
+                'tax': round(float(self.df[cols['tax']].sum()), 2),
+                'profit': round(float(self.df[cols['profit']].sum()), 2)}
 
     def _count_plot_data_by_years(self):
         """Підготовка даних для гістограми - доходи по роках"""
-        for pos, year in enumerate(sorted(self.df['year'].dropna().unique().tolist())):
-            y_profit = round(self.df.loc[self.df['year'] == year]['profit'].sum(), 2)
-            y_income = round(self.df.loc[self.df['year'] == year]['income'].sum(), 2)
-            y_tax = round(self.df.loc[self.df['year'] == year]['tax'].sum(), 2)
+        for pos, year in enumerate(sorted(self.df[cols['year']].dropna().unique().tolist())):
+            y_profit = round(self.df.loc[self.df[cols['year']] == year][cols['profit']].sum(), 2)
+            y_income = round(self.df.loc[self.df[cols['year']] == year][cols['income']].sum(), 2)
+            y_tax = round(self.df.loc[self.df[cols['year']] == year][cols['tax']].sum(), 2)
             self.years_dict.update({pos: [None, None, str(year), y_profit, y_income, y_tax]})
 
     def _count_plot_data_by_quarts(self):
@@ -148,9 +314,10 @@ class DocPartPerson(_DocEditorEmpty):
         df = self.df
         for q_order in range(self.quad_count):
             q_desc = f'{cur_year} ({cur_quad}кв.)'
-            q_profit = round(df.loc[(df['year'] == cur_year) & (df['quad'] == cur_quad)]['profit'].sum(), 2)
-            q_income = round(df.loc[(df['year'] == cur_year) & (df['quad'] == cur_quad)]['income'].sum(), 2)
-            q_tax = round(df.loc[(df['year'] == cur_year) & (df['quad'] == cur_quad)]['tax'].sum(), 2)
+            df_q = df.loc[(df[cols['year']] == cur_year) & (df[cols['quad']] == cur_quad)]
+            q_profit = round(df_q[cols['profit']].sum(), 2)
+            q_income = round(df_q[cols['income']].sum(), 2)
+            q_tax = round(df_q[cols['tax']].sum(), 2)
             self.quad_dict.update({q_order: [cur_year, cur_quad, q_desc, q_profit, q_income, q_tax]})
             cur_quad += 1
             if cur_quad == 5:
@@ -174,29 +341,31 @@ class DocPartPerson(_DocEditorEmpty):
 
     def _add_title(self):
         """Друк заголовку документа"""
-        self.document.add_paragraph(f'_______ (РНОКПП {str(self.person)})', style='central_header')
+        # У об'єднаному документі заголовок - пункт змісту:
+        self.document.add_paragraph(f'_______ (РНОКПП {str(self.person)})',
+                                    style='person_header' if self.combined else 'central_header')
         self.document.add_paragraph()
 
     @staticmethod
-    def df_format(df, headers):
-        """Форматування датафрейму для відображення у документі"""
-        df = df[headers].copy()
-
+    def df_format(df):
+        """
+        Форматування датафрейму для відображення у документі: формується новий датафрейм лише з колонками
+        для друку (вхідний датафрейм не змінюється і не копіюється)
+        """
         def f2s_wrap(val):
             return DocPartPerson.f2s(val)
 
-        df['income'] = df['income'].apply(lambda x: f2s_wrap(x))
-        df['tax'] = df['tax'].apply(lambda x: f2s_wrap(x))
-        # df['profit'] = df['profit'].apply(lambda x: f2s_wrap(x))
-
-        # Зменшення кількості колонок:
-        df['year'] = df['year'].astype(str) + ' (' + df['quad'].astype(str) + 'кв.)'
-        df['employer_name'] = df['employer_name'].astype(str) + ' (код ' + df['employer_id'].astype(str) + ')'
-        df = df[['year', 'employer_name', 'income', 'tax', 'desc']]
-        df.replace({'desc': dict_long}, inplace=True)
-        df.rename(columns=headersdict, inplace=True)
-        df.fillna('Не зазначено', inplace=True)
-        return df
+        # Зменшення кількості колонок (рік + квартал, назва + код агента):
+        df_view = pd.DataFrame({
+            'year': df[cols['year']].astype(str) + ' (' + df[cols['quad']].astype(str) + 'кв.)',
+            'employer_name': (df[cols['employer_name']].astype(str) + ' (код ' +
+                              df[cols['employer_id']].astype(str) + ')'),
+            'income': df[cols['income']].apply(lambda x: f2s_wrap(x)),
+            'tax': df[cols['tax']].apply(lambda x: f2s_wrap(x)),
+            'desc': df[cols['desc']].replace(dict_long)})
+        df_view.rename(columns=headersdict, inplace=True)
+        df_view.fillna('Не зазначено', inplace=True)
+        return df_view
 
     def _add_intro(self):
         """Друк вступний текст з загальною сумою доходу та середніми значеннями"""
@@ -205,9 +374,9 @@ class DocPartPerson(_DocEditorEmpty):
             f"Опрацюванням відомостей витягу Державного реєстру фізичних осіб - платників податків про суми доходів "
             f"та нарахованих податків (платник ______, РНОКПП {self.person}) за період {str(self.min_quad)[-1]}кв. "
             f"{self.min_year} року - {str(self.max_quad)[-1]}кв. {self.max_year} року (загальний період "
-            f"{self.dur_text}) встановлено отримання доходів на суму {self.f2s(self.df['income'].sum())} грн., "
-            f"утримано податків на суму {self.f2s(self.df['tax'].sum())} грн.")
-        p_points_intro.add_run(f" (прибуток складає {self.f2s(self.df['profit'].sum())} грн.):").bold = True
+            f"{self.dur_text}) встановлено отримання доходів на суму {self.f2s(self.df[cols['income']].sum())} грн., "
+            f"утримано податків на суму {self.f2s(self.df[cols['tax']].sum())} грн.")
+        p_points_intro.add_run(f" (прибуток складає {self.f2s(self.df[cols['profit']].sum())} грн.):").bold = True
 
         p_average_y = self.document.add_paragraph(style='List Bullet 2')
         p_average_y.add_run(f"в середньому на рік - ")
@@ -228,48 +397,14 @@ class DocPartPerson(_DocEditorEmpty):
             columns.append(v[2])
 
         data_np = np.array(data).transpose()
-        rows = ["Дохід", "Податок", 'Прибуток']
-        n_rows = len(data_np)
-
-        values = np.linspace(0, int(np.amax(data_np)), 5)  # положення підписів осі y
-        values_lbl = np.linspace(0, int(np.amax(data_np)) // 1000, 5)  # підписи осі y
-
-        colors = plt.cm.BuPu(np.linspace(0, 0.5, len(rows)))
-        index = np.linspace(0.5, len(columns) - 0.5, len(columns))  # положення барів по осі х
-        bar_width = 0.5
-
-        cell_text = []  # значення для заповнення таблички під графіком
-        for row in range(n_rows):
-            cell_text.append(['%d' % (x / 1000.0) for x in data_np[row]])
-        cell_text.reverse()
-
-        fig, ax = plt.subplots()
-        fig: Figure
-        fig.set_dpi(100)
-        fig.set_size_inches(10, 3.5, forward=True)
-        ax.set_xlim(0, len(columns))
-
-        plt.style.use('seaborn-whitegrid')
-        plt.bar(index, data_np[2], bar_width, color=colors[2], edgecolor='black')
-        plt.bar(index, data_np[0], bar_width, color=colors[1], edgecolor='black')
-
-        the_table = plt.table(cellText=cell_text,
-                              rowLabels=rows,
-                              colLabels=columns,
-                              loc='bottom')
-        the_table.scale(1, 2)
-
-        plt.ylabel("Тисяч грн.")
-        plt.yticks(values, ['%d' % val for val in values_lbl])
-        plt.xticks([])
-        plt.subplots_adjust(bottom=0.3)
-        ax.margins(x=0.0, y=0.05)
-        # plt.title('Дохід поквартально')
-
-        memory_file = io.BytesIO()
-        plt.savefig(memory_file)
         p_plot_timeline = self.document.add_paragraph(style='central_header')
-        p_plot_timeline.add_run().add_picture(memory_file, width=Cm(17))
+        if self.native_charts:  # діаграма Word: дохід, прибуток та податок (тис. грн.) з таблицею даних
+            add_bar_chart(p_plot_timeline.add_run(), columns,
+                          {'Дохід': data_np[2] / 1000, 'Прибуток': data_np[0] / 1000, 'Податок': data_np[1] / 1000},
+                          width=Cm(17), height=Cm(8), axis_title="Тисяч грн.")
+        else:
+            memory_file = bar_chart(columns, data_np, rows=["Дохід", "Податок", 'Прибуток'], target_cm=17)
+            add_picture(p_plot_timeline.add_run(), memory_file, width=Cm(17))
         self.document.add_paragraph(style='text_base')
 
     def _add_pie(self, data_ser: pd.Series, percent_limit=5, hide_labels=False):
@@ -287,65 +422,28 @@ class DocPartPerson(_DocEditorEmpty):
         vals = rate.to_list()
         vals_lbl = [re.sub(r"\B(?=(?:\d{3})+$)", ' ', str(int(x/1000))) for x in vals]  # у вигляді тис. з розділювачем
 
-        plt.style.use('seaborn-whitegrid')
-        fig, ax = plt.subplots()
-        fig: Figure
-        fig.set_dpi(100)
-        fig.set_size_inches(14, 6)
-        ax.margins(x=0.0, y=0.05)
-
-        pie_labels = order if hide_labels else desc
-        patches, texts, autotexts = ax.pie(vals,
-                                           labels=pie_labels,
-                                           autopct='%1.0f%%',
-                                           shadow=True,
-                                           # colors=colors,
-                                           startangle=90,
-                                           frame=False,
-                                           radius=1.1,
-                                           wedgeprops={"edgecolor": "k", 'linewidth': 0.8},
-                                           labeldistance=1.2,
-                                           explode=[0.05] * len(vals))
-        for t in texts:
-            t.set_fontsize(24)
-        for t in autotexts:
-            t.set_fontsize(24)
-
-        memory_file = io.BytesIO()
-        plt.savefig(memory_file)
         p_plot_pie = self.document.add_paragraph(style='central_header')
-        p_plot_pie.add_run().add_picture(memory_file, width=Cm(14))
+        if self.native_charts:
+            add_pie_chart(p_plot_pie.add_run(), order if hide_labels else desc, vals, width=Cm(14), height=Cm(8),
+                          name='Сума грн.')
+        else:
+            memory_file = pie_chart(order if hide_labels else desc, vals, target_cm=14)
+            add_picture(p_plot_pie.add_run(), memory_file, width=Cm(14))
         self.document.add_paragraph(style='text_base')
 
+        if self.native_charts:  # легенда - таблиця документа
+            legend = add_grid_table(self.document, ['№', 'Вид доходу', 'Тис.грн.'], zip(order, desc, vals_lbl),
+                                    widths=(Cm(1.5), Cm(8.5), Cm(2.5)),
+                                    aligns=(WD_PARAGRAPH_ALIGNMENT.CENTER, WD_PARAGRAPH_ALIGNMENT.LEFT,
+                                            WD_PARAGRAPH_ALIGNMENT.RIGHT))
+            legend.alignment = WD_TABLE_ALIGNMENT.CENTER
+            self.document.add_paragraph(style='text_base')
+            return
+
         # Додати графічну таблицю з легендою графіку:
-        fig, ax = plt.subplots()
-        fig: Figure
-        fig.set_dpi(100)
-        fig.set_size_inches(8, 0.3*len(vals_lbl))
-        plt.xticks([])
-        plt.yticks([])
-        ax.set_frame_on(False)
-        col_labels = ["Вид доходу", "Тис.грн."]
-        cell_text = []
-        for row in range(len(rate)):
-            cell_text.append([desc[row], vals_lbl[row]])
-
-        table = plt.table(cellText=cell_text,
-                          rowLabels=order,
-                          colLabels=col_labels,
-                          loc='center',
-                          colWidths=[0.9, 0.3],
-                          cellLoc='center')
-        table.auto_set_font_size(False)
-        table.set_fontsize(14)
-        table.scale(1, 1.3)
-        # plt.subplots_adjust(bottom=0.3)
-        ax.margins(x=0.0, y=0.05)
-
-        memory_file = io.BytesIO()
-        plt.savefig(memory_file)
+        memory_file = legend_table(order, desc, vals_lbl, target_cm=12)
         p_plot_pie_table = self.document.add_paragraph(style='central_header')
-        p_plot_pie_table.add_run().add_picture(memory_file, width=Cm(12))
+        add_picture(p_plot_pie_table.add_run(), memory_file, width=Cm(12))
         self.document.add_paragraph(style='text_base')
 
     def _add_profit_sources(self):
@@ -354,7 +452,7 @@ class DocPartPerson(_DocEditorEmpty):
         p_sources = self.document.add_paragraph('', style='text_base')
         p_sources.add_run('Джерела доходів:').bold = True
 
-        employer_rating = self.df.groupby('employer_id')['income'].sum()
+        employer_rating = self.df.groupby(cols['employer_id'])[cols['income']].sum()
         employer_rating = employer_rating.sort_values(ascending=False)
         emp_df = self._prep_emp_df(employer_rating)
 
@@ -367,12 +465,10 @@ class DocPartPerson(_DocEditorEmpty):
         p_signs = self.document.add_paragraph('', style='text_base')
         p_signs.add_run('Ознаки (види) доходів:').bold = True
 
-        signs_rating = self.df.groupby('desc')['income'].sum()
+        signs_rating = self.df.groupby(cols['desc'])[cols['income']].sum()
         signs_rating = signs_rating.sort_values(ascending=False)
 
-        df_short = self.df[['desc', 'income']].copy()
-        df_short.replace({'desc': dict_short}, inplace=True)
-        signs_rating_pie = df_short.groupby('desc')['income'].sum()
+        signs_rating_pie = self.df[cols['income']].groupby(self.df[cols['desc']].replace(dict_short)).sum()
         if len(signs_rating_pie) > 1:
             self._add_pie(signs_rating_pie)
 
@@ -380,8 +476,8 @@ class DocPartPerson(_DocEditorEmpty):
             s_p = self.document.add_paragraph(f"{self.f2s(signs_rating[sign])} грн. - {dict_long.get(sign, sign)}",
                                               style='List Bullet')
             if self.sub_list_text:
-                df_sign = self.df.loc[self.df['desc'] == sign]
-                employers_in_sign = df_sign.groupby('employer_id')['income'].sum()
+                df_sign = self.df.loc[self.df[cols['desc']] == sign]
+                employers_in_sign = df_sign.groupby(cols['employer_id'])[cols['income']].sum()
                 employers_in_sign = employers_in_sign.sort_values(ascending=False)
                 if len(employers_in_sign) > 0:
                     s_p.add_run(':')
@@ -390,8 +486,8 @@ class DocPartPerson(_DocEditorEmpty):
                                                     f"({self.sources_dict.get(cur_emp, 'назва не зазначається')})",
                                                     style='List Bullet 2')
             if self.sub_list_table:
-                df_sign = self.df.loc[self.df['desc'] == sign]
-                employers_in_sign = df_sign.groupby('employer_id')['income'].sum()
+                df_sign = self.df.loc[self.df[cols['desc']] == sign]
+                employers_in_sign = df_sign.groupby(cols['employer_id'])[cols['income']].sum()
                 employers_in_sign = employers_in_sign.sort_values(ascending=False)
                 if len(employers_in_sign) > 0:
                     s_p.add_run(':')
@@ -410,14 +506,14 @@ class DocPartPerson(_DocEditorEmpty):
         else:  # Графік з поквартальною деталізацією, якщо даних небагато
             self._add_plot(self.quad_dict)
 
-        years_rating = self.df.groupby('year')['income'].sum()
+        years_rating = self.df.groupby(cols['year'])[cols['income']].sum()
         years_rating = years_rating.sort_index(ascending=False)
         for year in list(years_rating.index):
             y_p = self.document.add_paragraph(f"{year} рік - {self.f2s(years_rating[year])} грн.", style='List Bullet')
 
             if self.sub_list_text:
-                df_year = self.df.loc[self.df['year'] == year]
-                year_emps = df_year.groupby('employer_id')['income'].sum()
+                df_year = self.df.loc[self.df[cols['year']] == year]
+                year_emps = df_year.groupby(cols['employer_id'])[cols['income']].sum()
                 if len(years_rating) > 0:
                     y_p.add_run(':')
                     year_emps = year_emps.sort_values(ascending=False)
@@ -426,8 +522,8 @@ class DocPartPerson(_DocEditorEmpty):
                                                     f"({self.sources_dict.get(emp, 'назва не зазначається')})",
                                                     style='List Bullet 2')
             if self.sub_list_table:
-                df_year = self.df.loc[self.df['year'] == year]
-                year_emps = df_year.groupby('employer_id')['income'].sum()
+                df_year = self.df.loc[self.df[cols['year']] == year]
+                year_emps = df_year.groupby(cols['employer_id'])[cols['income']].sum()
                 year_emps = year_emps.sort_values(ascending=False)
                 if len(years_rating) > 0:
                     y_p.add_run(':')
@@ -438,95 +534,33 @@ class DocPartPerson(_DocEditorEmpty):
     def _add_common_table(self, df: pd.DataFrame):
         """Додавання до документа таблиці з відомостями про всі доходи деталізовано"""
         assert len(df.columns) == 5, 'Очікується, що в загальній таблиці має бути 5 колонок'
-        df = df.copy(deep=True)
-        df: pd.DataFrame
-        df.reset_index(inplace=True, drop=True)
 
         p_table_intro = self.document.add_paragraph(style='text_base')
         p_table_intro.add_run("Деталізована таблиця відомостей про отримані доходи: ")
 
-        # Створення таблиці та заповнення кольором заголовків:
-        tab = self.document.add_table(rows=df.shape[0] + 1, cols=len(df.columns))
-        tab.allow_autofit = False
-        tab.style = 'Table Grid'
-        headers = list(df.columns)
-        for pos, header in enumerate(headers):
-            tab.rows[0].cells[pos].text = str(header)
-            cell_xml_element = tab.rows[0].cells[pos]._tc
-            table_cell_properties = cell_xml_element.get_or_add_tcPr()
-            shade_obj = OxmlElement('w:shd')
-            shade_obj.set(qn('w:fill'), 'd9d9d9')
-            table_cell_properties.append(shade_obj)
-
-        # Внесення даних у таблицю
-        for row_index, row in df.iterrows():
-            pos = row_index + 1
-            for df_cell in range(len(df.columns)):
-                tab.rows[pos].cells[df_cell].text = str(df.iat[row_index, df_cell])
-
-        # Центрування колонок
-        for row in range(len(tab.rows)):
-            tab.rows[row].cells[0].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-            tab.rows[row].cells[1].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
-            tab.rows[row].cells[2].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
-            tab.rows[row].cells[3].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
-            tab.rows[row].cells[4].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
-
-        # Формат заголовків таблиці
-        for cell_pos in range(len(headers)):
-            tab.rows[0].cells[cell_pos].paragraphs[0].runs[0].font.bold = True
-            tab.rows[0].cells[cell_pos].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-
-        # Встановлення ширини колонок
+        headers = [str(header) for header in df.columns]
         widths = (Cm(2), Cm(5.5), Cm(2), Cm(2), Cm(5.5))
-        for row in tab.rows:
-            for idx, width in enumerate(widths):
-                row.cells[idx].width = width
+        aligns = (WD_PARAGRAPH_ALIGNMENT.CENTER, WD_PARAGRAPH_ALIGNMENT.LEFT, WD_PARAGRAPH_ALIGNMENT.RIGHT,
+                  WD_PARAGRAPH_ALIGNMENT.RIGHT, WD_PARAGRAPH_ALIGNMENT.LEFT)
+        if self.stream_rows is not None and len(df) >= self.stream_rows:
+            # Рядки великої таблиці записуються у файл під час збереження (частинами, без дерева XML):
+            add_streamed_table(self.document, headers, lambda: df.itertuples(index=False, name=None), widths, aligns)
+        else:
+            # Розмітка всіх рядків формується за один прохід (позиційно, без перевпорядкування індексу датафрейму):
+            add_grid_table(self.document, headers, df.itertuples(index=False, name=None), widths, aligns)
 
         self.document.add_paragraph(style='text_base')
 
     def _add_employer_table(self, df: pd.DataFrame):
         """Додавання до документу таблиці зі статистикою отриманих сум від працедавців"""
         assert len(df.columns) == 3, 'Очікується, що в таблиці працедавців має бути 3 колонки'
-        df = df.copy(deep=True)
-        df: pd.DataFrame
-        df.reset_index(inplace=True, drop=True)
-
-        # Створення таблиці та заповнення кольором заголовків:
-        tab = self.document.add_table(rows=df.shape[0] + 1, cols=len(df.columns))
-        tab.allow_autofit = False
-        tab.style = 'Table Grid'
-        headers = list(df.columns)
-        for pos, header in enumerate(headers):
-            tab.rows[0].cells[pos].text = str(header)
-            cell_xml_element = tab.rows[0].cells[pos]._tc
-            table_cell_properties = cell_xml_element.get_or_add_tcPr()
-            shade_obj = OxmlElement('w:shd')
-            shade_obj.set(qn('w:fill'), 'd9d9d9')
-            table_cell_properties.append(shade_obj)
-
-        # Внесення даних у таблицю
-        for row_index, row in df.iterrows():
-            pos = row_index + 1
-            for df_cell in range(len(df.columns)):
-                tab.rows[pos].cells[df_cell].text = str(df.iat[row_index, df_cell])
-
-        # Центрування колонок
-        for row in range(len(tab.rows)):
-            tab.rows[row].cells[0].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
-            tab.rows[row].cells[1].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-            tab.rows[row].cells[2].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
-
-        # Формат заголовків таблиці
-        for cell_pos in range(len(headers)):
-            tab.rows[0].cells[cell_pos].paragraphs[0].runs[0].font.bold = True
-            tab.rows[0].cells[cell_pos].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-
-        # Встановлення ширини колонок
-        widths = (Cm(2.5), Cm(2.5), Cm(12.0))
-        for row in tab.rows:
-            for idx, width in enumerate(widths):
-                row.cells[idx].width = width
+
+        add_grid_table(self.document,
+                       headers=[str(header) for header in df.columns],
+                       rows=df.itertuples(index=False, name=None),
+                       widths=(Cm(2.5), Cm(2.5), Cm(12.0)),
+                       aligns=(WD_PARAGRAPH_ALIGNMENT.RIGHT, WD_PARAGRAPH_ALIGNMENT.CENTER,
+                               WD_PARAGRAPH_ALIGNMENT.LEFT))
         self.document.add_paragraph(style='text_base')
 
     def _prep_emp_df(self, employer_rating: pd.Series):
@@ -536,8 +570,7 @@ class DocPartPerson(_DocEditorEmpty):
         data = [emp_vals_list, emp_code_list, emp_code_list]
         emp_df = pd.DataFrame(data).transpose()
         emp_df.columns = ['Сума грн.', "Код агента", "Найменування"]
-        emp_df.replace({'Найменування': self.sources_dict}, inplace=True)
-        emp_df['Найменування'] = emp_df['Найменування'].apply(lambda cell: self.company_title(cell))
+        emp_df['Найменування'] = emp_df['Найменування'].map(self.titles_dict).fillna(emp_df['Найменування'])
 
         def f2s_wrap(val):
             return DocPartPerson.f2s(val)
@@ -546,10 +579,9 @@ class DocPartPerson(_DocEditorEmpty):
 
     def _pivot_tab_data(self):
         """Підготовка списку з даними для зведеної таблиці (клітинки, що мають злитись вертикально - порожні)"""
-        df = self.df.copy()
-        piv = pd.pivot_table(df,
-                             index=['year', 'desc', 'employer_id'],
-                             values=['profit'],
+        piv = pd.pivot_table(self.df,
+                             index=[cols['year'], cols['desc'], cols['employer_id']],
+                             values=[cols['profit']],
                              aggfunc=np.sum)
         indexes = list(piv.index)
         cells = []
@@ -575,7 +607,7 @@ class DocPartPerson(_DocEditorEmpty):
                 row.append('')
 
             row.append(f'КОД {str(indexes[turn][2])} - '
-                       f'{self.company_title(self.sources_dict.get(indexes[turn][2], "(!)"))}')
+                       f'{self.titles_dict.get(indexes[turn][2], "(!)")}')
                        # f'({self.f2s(piv.loc[int(cur_y), indexes[turn][1], indexes[turn][2]].sum())} грн.)'
             row[1], row[3] = row[3], row[1]
             row[1], row[2] = row[2], row[1]
@@ -585,10 +617,7 @@ class DocPartPerson(_DocEditorEmpty):
     @staticmethod
     def company_title(full_name):
         """Застосування скорочень до найменування організаційно-правової форми юридичної особи"""
-        full_name = re.sub(' +', ' ', full_name)
-        for key, value in dict_company_types.items():
-            full_name = re.sub(key, value.upper(), full_name, flags=re.IGNORECASE)
-        return full_name
+        return company_title(full_name)
 
     def _pivot_tab_add(self, data: List[List[str]]):
         """Додавання до документу форматованої зведеної таблиці РІК - ВИД - ЮРИДИЧНА ОСОБА - СУМА ЗА РІК """
@@ -596,80 +625,20 @@ class DocPartPerson(_DocEditorEmpty):
         p_table_intro = self.document.add_paragraph(style='text_base')
         p_table_intro.add_run("Зведена таблиця доходів в розрізі періодів та видів: ")
 
-        # Створення таблиці та заповнення кольором заголовків:
-        tab = self.document.add_table(rows=len(data) + 1, cols=len(headers))
-        tab.allow_autofit = False
-        tab.style = 'Table Grid'
-        for pos, header in enumerate(headers):
-            tab.rows[0].cells[pos].text = str(header)
-            cell_xml_element = tab.rows[0].cells[pos]._tc
-            table_cell_properties = cell_xml_element.get_or_add_tcPr()
-            shade_obj = OxmlElement('w:shd')
-            shade_obj.set(qn('w:fill'), 'd9d9d9')
-            table_cell_properties.append(shade_obj)
-
-        # Внесення даних у таблицю
-        for row_index, row in enumerate(data):
-            pos = row_index + 1
-            for cell in range(len(row)):
-                tab.rows[pos].cells[cell].text = data[row_index][cell]
-
-        # Злиття клітинок:
-        for column in range(len(headers)):
-            last_filled = 0
-            for row in range(len(tab.rows)):
-                if tab.rows[row].cells[column].paragraphs[0].runs[0].text != "":
-                    if (row - last_filled) > 1:
-                        a = tab.rows[last_filled].cells[column]
-                        b = tab.rows[row-1].cells[column]
-                        a.merge(b)
-                    last_filled = row
-
-            if tab.rows[-1].cells[column].paragraphs[0].runs[0].text == "":
-                a = tab.rows[last_filled].cells[column]
-                b = tab.rows[-1].cells[column]
-                a.merge(b)
-
-        # Центрування колонок
-        for row in range(len(tab.rows)):
-            tab.rows[row].cells[0].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-            tab.rows[row].cells[1].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
-            tab.rows[row].cells[2].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
-            tab.rows[row].cells[3].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
-
-        # Центрування клітинок по вертикалі
-        for row in range(len(tab.rows)):
-            for vertical_col in [0, 1, 3]:
-                tab.rows[row].cells[vertical_col].vertical_alignment = WD_CELL_VERTICAL_ALIGNMENT.CENTER
-                # tab.rows[row].cells[vertical_col].paragraphs[0].alignment = WD_CELL_VERTICAL_ALIGNMENT.CENTER
-
-        # Формат років (значень першої колонки)
-        for row in range(len(tab.rows)):
-            tab.rows[row].cells[0].paragraphs[0].runs[0].font.bold = True
-            tab.rows[row].cells[0].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-
-        # Формат заголовків таблиці
-        for cell_pos in range(len(headers)):
-            tab.rows[0].cells[cell_pos].paragraphs[0].runs[0].font.bold = True
-            tab.rows[0].cells[cell_pos].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-            tab.rows[0].cells[cell_pos].paragraphs[0].alignment = WD_CELL_VERTICAL_ALIGNMENT.CENTER
-
-        # Встановлення ширини колонок
+        # Формат колонок: рік - жирний по центру; рік, вид та сума - по центру клітинки по вертикалі
         widths = (Cm(1), Cm(4.7), Cm(8.8), Cm(2.5))
-        for row in tab.rows:
-            for idx, width in enumerate(widths):
-                row.cells[idx].width = width
-
-        # Видалення порожніх рядків після злиття:
-        for column in range(len(headers)):
-            for row in range(len(tab.rows)):
-                cur_paragraphs = tab.rows[row].cells[column].paragraphs
-                if len(cur_paragraphs) > 1:
-                    for paragraph in cur_paragraphs[1:]:
-                        if len(paragraph.text) == 0:
-                            p = paragraph._element
-                            p.getparent().remove(p)
-                            p._p = p._element = None
+        v_aligns = ('center', 'center', None, 'center')
+        aligns = (WD_PARAGRAPH_ALIGNMENT.CENTER, WD_PARAGRAPH_ALIGNMENT.LEFT, WD_PARAGRAPH_ALIGNMENT.LEFT,
+                  WD_PARAGRAPH_ALIGNMENT.RIGHT)
+        header_formats = [CellFormat(width, WD_PARAGRAPH_ALIGNMENT.CENTER, v_align, bold=True, fill=header_fill)
+                          for width, v_align in zip(widths, v_aligns)]
+        formats = [CellFormat(width, align, v_align, bold=(pos == 0))
+                   for pos, (width, align, v_align) in enumerate(zip(widths, aligns, v_aligns))]
+
+        # Порожні клітинки даних зливаються вертикально з клітинкою групи (рік, вид, сума за рік) над ними -
+        # розмітка об'єднання формується разом з рядками таблиці:
+        add_grid_table(self.document, headers, data, widths, aligns,
+                       header_formats=header_formats, formats=formats, merges=vertical_merges(data))
 
         self.document.add_paragraph(style='text_base')
 
@@ -6,6 +6,7 @@
     - підготовка датафрейму до експорту
 """
 
+import os
 import re
 from pathlib import Path
 from typing import Union
@@ -15,6 +16,13 @@ import numpy as np
 import xml.etree.ElementTree as ET
 
 from defines import dict_short, response, service_col_names, tech_headers
+from company_names import company_titles
+from excel_writer import (StreamWorkbook, frame_rows, apply_number_format, sum_format, sheet_title, sheet_link,
+                          sheet_rows_limit)
+from text_writer import write_csv, write_ndjson
+from dataset import ColumnDataset, save_dataset
+from process_pool import run_bounded
+from xml_writer import write_declar, xml_parts
 
 
 class CellProfit:
@@ -38,7 +46,18 @@ class FileProfitXML:
     headers = tech_headers
     col_int = ['g5', 'g10', 'g11', 'g12']
     col_float = ['g8', 'g9']
-    
+    sum_headers = ['Дохід', 'Податок', 'Прибуток']  # колонки сум (форматованого датафрейму)
+    pivot_titles = {'Pt_General': 'Загальні суми',
+                    'Pt_Feature': 'Суми за ознаками доходу',
+                    'Pt_QY': 'Суми за роками та кварталами'}
+    declar_codes = [506, 509, 512]  # декларації платника єдиного податку (6 міс., 9 міс., рік)
+    employers_headers = {'g6s': 'Код агента',
+                         'name': 'Назва агента',
+                         'title': 'Скорочена назва',
+                         'first_quad': 'Перший квартал',
+                         'last_quad': 'Останній квартал',
+                         'rows': 'Кількість записів'}
+
     signs = {}
     for key, value in dict_short.items():
         signs[key] = str(key) + " - " + value
@@ -51,7 +70,61 @@ class FileProfitXML:
         self.max_rows = 0
         self.columns = set()
         self.df = pd.DataFrame()
+        self.employers = pd.DataFrame()
+        # Проміжні декларації єдиного податку, виключені пізнішим звітом (відновлюються, якщо пізніший звіт
+        # замінено при доповненні даних - append_df; None - невідомі, доповнення недоступне):
+        self.declar_dropped = pd.DataFrame()
         self.cells_collection = []
+        self.xml_parts = None  # частини документа-джерела для зворотного запису XML (xml_writer.xml_parts)
+        self._reset_cache()
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame, file: Union[str, Path] = '', employers: pd.DataFrame = None,
+                declar_dropped: pd.DataFrame = None):
+        """
+        Створення екземпляру з вже очищеного датафрейму (зведені, відібрані або завантажені з іншого джерела
+        записи) - для використання наявних експортів Excel/Word без повторного імпорту XML
+
+        :param df: датафрейм з колонками g2s...g12 та profit (колонка year_quad додається за відсутності)
+        :param file: файл-джерело (для довідки)
+        :param employers: готовий довідник агентів (None - розрахувати за df)
+        :param declar_dropped: проміжні декларації, виключені під час очищення записів df (None - невідомі,
+                               доповнення даних append_xml/append_df недоступне)
+        """
+        inst = cls(file)
+        if 'year_quad' not in df.columns:
+            # Новий датафрейм з колонкою (датафрейм викликача не змінюється):
+            df = df.assign(year_quad=df['g12'].astype(int) * 10 + df['g11'].astype(int))
+        inst.df = df
+        inst.columns = set(df.columns).intersection(service_col_names.keys())
+        inst.employers = employers if employers is not None else cls.employers_table(df)
+        inst.declar_dropped = declar_dropped
+        return inst
+
+    @classmethod
+    def from_dataset(cls, directory: Union[str, Path], years=None, persons=None):
+        """
+        Створення екземпляру з колонкового набору даних (save_dataset): з диска читаються лише частини
+        відібраних років/платників
+
+        :param directory: каталог набору
+        :param years: роки (None - всі)
+        :param persons: РНОКПП платників (None - всі)
+        """
+        source = ColumnDataset(directory)
+        return cls.from_df(source.read(years=years, persons=persons), file=str(directory),
+                           employers=source.employers(), declar_dropped=source.declar_dropped(years, persons))
+
+    def save_dataset(self, directory: Union[str, Path], buckets: int = 16) -> dict:
+        """
+        Збереження очищених даних у колонковий набір (частини за роком і кошиком платника, колонки - .npy)
+
+        :param directory: каталог набору (наявний набір замінюється)
+        :param buckets: кількість кошиків платників у межах року
+        :return: опис набору (manifest)
+        """
+        return save_dataset(self.df, directory, employers=self.employers, buckets=buckets,
+                            declar_dropped=self.declar_dropped)
 
     def read_xml(self) -> int:
         """
@@ -64,6 +137,7 @@ class FileProfitXML:
         except Exception:
             return 1
 
+        self.xml_parts = xml_parts(tree.getroot())
         body = tree.find('DECLARBODY')
         for elem in body:
             adr = str(elem.tag)
@@ -181,36 +255,112 @@ class FileProfitXML:
             return warnings
 
         # Виправлення дублювання коштів у звітах (6-місяців, 9-місяців, річних) для декларацій єдиного податку:
-        self.df = self._tax_declaration_fix(self.df)
+        self.df, self.declar_dropped = self._tax_declaration_fix(self.df)
+
+        # Розрахунок колонки прибутку та порядкового номеру кварталу (рік * 10 + квартал):
+        for df in (self.df, self.declar_dropped):
+            df['profit'] = df['g8'] - df['g9']
+            df['year_quad'] = df['g12'].astype(int) * 10 + df['g11'].astype(int)
 
-        # Розрахунок колонки прибутку:
-        self.df['profit'] = self.df['g8'] - self.df['g9']
+        # Довідник агентів (спільний для звітів Word та експорту Excel):
+        self.employers = self.employers_table(self.df)
+        self._reset_cache()
         return warnings
 
+    def _reset_cache(self):
+        """Скидання похідних даних, що залежать від вмісту датафрейму (індекси, агрегати зведених таблиць)"""
+        self._person_rows = None
+        self._pivot_base_df = None
+        self._pivot_cache = {}
+
+    def person_rows(self) -> dict:
+        """
+        Індекс позицій рядків кожного платника у датафреймі (РНОКПП: масив позицій) - для вибірки записів
+        особи без маскування всього датафрейму. Розраховується один раз після імпорту/доповнення даних.
+        """
+        if self._person_rows is None:
+            self._person_rows = self.df.groupby('g3s', sort=False).indices
+        return self._person_rows
+
+    def person_df(self, person) -> pd.DataFrame:
+        """
+        Записи однієї особи: якщо рядки особи йдуть підряд (типово для витягів) - зріз без копіювання даних,
+        інакше - вибірка лише рядків особи
+        """
+        rows = self.person_rows()[person]
+        if rows[-1] - rows[0] + 1 == len(rows):
+            return self.df.iloc[rows[0]:rows[-1] + 1]
+        return self.df.take(rows)
+
+    @staticmethod
+    def employers_table(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Формування довідника агентів за один прохід по датафрейму: код агента (індекс) - канонічна назва
+        (найчастіше вживана у записах), скорочена назва, перший/останній квартал (рік * 10 + квартал)
+        та кількість записів
+
+        :param df: очищений датафрейм (з колонкою year_quad)
+        :return: датафрейм з індексом g6s
+        """
+        columns = ['name', 'title', 'first_quad', 'last_quad', 'rows']
+        df = df[['g6s', 'g7s', 'year_quad']].dropna(subset=['g6s'])
+        if df.shape[0] == 0:
+            return pd.DataFrame(columns=columns)
+
+        # Канонічна назва - варіант, що зустрічається найчастіше (при рівності - перший у файлі):
+        names = df.groupby(['g6s', 'g7s'], sort=False).size().reset_index(name='count')
+        names = names.sort_values('count', ascending=False, kind='stable').drop_duplicates('g6s')
+        names = names.set_index('g6s')['g7s']
+
+        employers = df.groupby('g6s').agg(first_quad=('year_quad', 'min'),
+                                          last_quad=('year_quad', 'max'),
+                                          rows=('year_quad', 'size'))
+        employers['name'] = names
+        # Скорочення розраховуються один раз для кожної унікальної назви (з кешем між файлами та запусками):
+        employers['title'] = company_titles.titles(employers['name'])
+        return employers[columns]
+
+    def _get_formatted_employers(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Форматування довідника агентів (лише тих, що присутні у df) для експорту в Excel"""
+        codes = df['g6s'].dropna().unique() if 'g6s' in df.columns else df['Код агента'].unique()
+        emp = self.employers.loc[self.employers.index.isin(codes)].reset_index()
+        emp.rename(columns={'index': 'g6s'}, inplace=True)
+        for col in ['first_quad', 'last_quad']:
+            emp[col] = (emp[col] // 10).astype(str) + ' (' + (emp[col] % 10).astype(str) + 'кв.)'
+        emp.rename(columns=self.employers_headers, inplace=True)
+        return emp
+
+    @staticmethod
+    def f2s(amount):
+        """Перетворення числа у рядок формату 1 200 000.00"""
+        try:
+            thou_sep = ' '
+            deci_sep = '.'
+            w_dec = '%.2f' % amount
+            part_int = w_dec.split('.')[0]
+            part_int = re.sub(r"\B(?=(?:\d{3})+$)", thou_sep, part_int)
+            part_dec = w_dec.split('.')[1]
+            return part_int + deci_sep + part_dec
+        except Exception:
+            print(f'Error with float value {amount} (type {type(amount)}) - cant convert to string')
+            return '0.00'
+
+    @staticmethod
+    def info_columns(add_profit=True) -> list:
+        """Колонки аркуша Info (у порядку виведення)"""
+        if add_profit:
+            return ['g2s', 'g3s', 'g4s', 'g5', 'g6s', 'g7s', 'g8', 'g9', 'profit', 'g10', 'g11', 'g12']
+        return ['g2s', 'g3s', 'g4s', 'g5', 'g6s', 'g7s', 'g8', 'g9', 'g10', 'g11', 'g12']
+
     def _get_formatted_df(self, external_df=None, format_float=True, add_profit=True) -> pd.DataFrame:
         if not type(external_df) == pd.DataFrame:
             df = self.df
         else:
             df = external_df
 
-        if add_profit:
-            df_view = df[['g2s', 'g3s', 'g4s', 'g5', 'g6s', 'g7s', 'g8', 'g9', 'profit', 'g10', 'g11', 'g12']].copy()
-        else:
-            df_view = df[['g2s', 'g3s', 'g4s', 'g5', 'g6s', 'g7s', 'g8', 'g9', 'g10', 'g11', 'g12']].copy()
-
-        def f2s(amount):
-            try:
-                thou_sep = ' '
-                deci_sep = '.'
-                w_dec = '%.2f' % amount
-                part_int = w_dec.split('.')[0]
-                part_int = re.sub(r"\B(?=(?:\d{3})+$)", thou_sep, part_int)
-                part_dec = w_dec.split('.')[1]
-                return part_int + deci_sep + part_dec
-            except Exception:
-                print(f'Error with float value {amount} (type {type(amount)}) - cant convert to string')
-                return '0.00'
+        df_view = df[self.info_columns(add_profit)].copy()
 
+        f2s = self.f2s
         if format_float:
             df_view['g8'] = df_view['g8'].apply(lambda x: f2s(x))
             df_view['g9'] = df_view['g9'].apply(lambda x: f2s(x))
@@ -220,76 +370,474 @@ class FileProfitXML:
         df_view.rename(columns=self.headers, inplace=True)
         df_view.fillna('Не зазначено', inplace=True)
         return df_view
-    
-    def write_pt(self, df, file, add_profit=True):
-        
-        if add_profit:
-            values = ['Дохід', 'Податок', 'Прибуток']
-        else:
-            values = ['Дохід', 'Податок']
 
-        df_General = df.pivot_table(index = ['РНОКПП'], values=values, aggfunc = np.sum)
-        df_Feature = df.pivot_table(index = ['РНОКПП', 'Ознака доходу'], values=values, aggfunc = np.sum,
-                            margins = True, margins_name='Total')
-        df_QY = df.pivot_table(index = ['РНОКПП', 'Рік', 'Ознака доходу'], columns=['Квартал'], values=values, aggfunc = np.sum,
-                            margins = True, margins_name='Total')
+    def _pivot_base(self) -> pd.DataFrame:
+        """
+        Суми доходу, податку та прибутку за найдрібнішим розрізом (платник, рік, ознака доходу, квартал) -
+        одне групування числових даних для всіх зведених таблиць (кешується до зміни датафрейму)
+        """
+        if self._pivot_base_df is None:
+            base = self.df.groupby(['g3s', 'g12', 'g10', 'g11'])[['g8', 'g9', 'profit']].sum()
+            base.index.names = [self.headers[col] for col in base.index.names]
+            base.columns = [self.headers[col] for col in base.columns]
+            self._pivot_base_df = base
+        return self._pivot_base_df
+
+    def pivot_tables(self, person=None, add_profit=True) -> dict:
+        """
+        Зведені таблиці аркушів Pt_General, Pt_Feature, Pt_QY: згортання одного групування числових даних
+        (_pivot_base) з підсумками Total. Результат кешується для кожного набору параметрів.
+
+        :param person: РНОКПП (None - всі записи)
+        :param add_profit: додати суми прибутку
+        :return: словник {назва аркуша: числовий датафрейм}
+        """
+        key = (person, add_profit)
+        if key in self._pivot_cache:
+            return self._pivot_cache[key]
+
+        values = ['Дохід', 'Податок', 'Прибуток'] if add_profit else ['Дохід', 'Податок']
+        base = self._pivot_base()
+        if person is not None:
+            base = base.loc[base.index.get_level_values(0) == person]
+        base = base[values].rename(index=self.signs, level='Ознака доходу')
+
+        def add_total_row(df: pd.DataFrame) -> pd.DataFrame:
+            label = ('Total',) + ('',) * (df.index.nlevels - 1) if df.index.nlevels > 1 else 'Total'
+            total = pd.DataFrame([df.sum()], columns=df.columns,
+                                 index=pd.MultiIndex.from_tuples([label], names=df.index.names)
+                                 if df.index.nlevels > 1 else pd.Index([label], name=df.index.name))
+            return pd.concat([df, total])
+
+        df_General = base.groupby(level='РНОКПП').sum()
+        df_Feature = add_total_row(base.groupby(level=['РНОКПП', 'Ознака доходу']).sum())
+
+        # Квартали у колонках, підсумок по кварталах - колонка Total для кожного показника:
+        df_QY = base.unstack('Квартал')
+        row_totals = base.groupby(level=['РНОКПП', 'Рік', 'Ознака доходу']).sum()
+        df_QY = pd.concat([pd.concat([df_QY[value], row_totals[[value]].rename(columns={value: 'Total'})], axis=1)
+                           for value in values], axis=1, keys=values, names=[None, 'Квартал'])
+        df_QY = add_total_row(df_QY)
+
+        pivots = {'Pt_General': df_General, 'Pt_Feature': df_Feature, 'Pt_QY': df_QY}
+        self._pivot_cache[key] = pivots
+        return pivots
+
+    def _format_pivots(self, pivots: dict, format_float=True) -> dict:
+        """Форматування сум зведених таблиць лише під час запису (12300.0 -> 12 300.00, відсутні - порожні)"""
+        if not format_float:
+            return pivots
+        formatted = {}
+        for name, df in pivots.items():
+            df = df.astype(object)
+            for pos in range(df.shape[1]):  # по колонках за позицією (колонки зведених таблиць - MultiIndex)
+                df.isetitem(pos, df.iloc[:, pos].map(lambda x: self.f2s(x) if pd.notna(x) else None))
+            formatted[name] = df
+        return formatted
+
+    def write_pt(self, df, file, add_profit=True, pivots: dict = None, number_format=False, shard_by_year=False):
+        """
+        Запис книги Excel: форматований датафрейм (аркуш Info), зведені таблиці, довідники
+
+        :param df: форматований датафрейм (_get_formatted_df)
+        :param pivots: зведені таблиці (None - за всіма записами, pivot_tables)
+        :param number_format: числовий формат Excel для колонок сум (суми мають бути числами)
+        :param shard_by_year: розподіл записів, що не вміщуються на аркуш Info, по роках (info_shards)
+        """
+        if pivots is None:
+            pivots = self.pivot_tables(add_profit=add_profit)
         df_unique_ipn = df[['РНОКПП', 'Особа №']]
         df_unique_ipn = df_unique_ipn.drop_duplicates(subset = ['РНОКПП', 'Особа №']).reset_index(drop = True)
-        
+        df_employers = self._get_formatted_employers(df)
+
+        shards = self.info_shards(df, self.headers['g12'] if shard_by_year else None)
         with pd.ExcelWriter(file) as writer:
-            df.to_excel(writer, sheet_name='Info', index=False)
-            df_General.to_excel(writer, sheet_name='Pt_General')
-            df_Feature.to_excel(writer, sheet_name='Pt_Feature')
-            df_QY.to_excel(writer, sheet_name='Pt_QY')
+            for sheet_name, df_shard in shards:
+                df_shard.to_excel(writer, sheet_name=sheet_name, index=False)
+            for sheet_name, df_pivot in pivots.items():
+                df_pivot.to_excel(writer, sheet_name=sheet_name)
             df_unique_ipn.to_excel(writer, sheet_name='Handbook', index=False)
+            df_employers.to_excel(writer, sheet_name='Agents', index=False)
+
+            if number_format:
+                sum_columns = [df.columns.get_loc(col) + 1 for col in self.sum_headers if col in df.columns]
+                for sheet_name, _ in shards:
+                    apply_number_format(writer.sheets[sheet_name], sum_columns)
+                for sheet_name, df_pivot in pivots.items():
+                    first = df_pivot.index.nlevels + 1
+                    apply_number_format(writer.sheets[sheet_name], range(first, first + df_pivot.shape[1]))
+
+    def write_pt_stream(self, df, file, format_float=True, add_profit=True, chunk_size=50000, pivots: dict = None,
+                        number_format=False, shard_by_year=False):
+        """
+        Потоковий запис книги Excel (openpyxl write-only): аркуш Info форматується та записується частинами
+        по chunk_size рядків, тому пам'ять не зростає з кількістю записів. Набір аркушів - як у write_pt.
+
+        :param df: очищений (неформатований) датафрейм
+        :param pivots: зведені таблиці (None - за всіма записами, pivot_tables)
+        :param number_format: суми - числа з форматом Excel (замість рядків format_float)
+        :param shard_by_year: розподіл записів, що не вміщуються на аркуш Info, по роках (info_shards)
+        """
+        if number_format:
+            format_float = False
+        if pivots is None:
+            pivots = self._format_pivots(self.pivot_tables(add_profit=add_profit), format_float)
+
+        with StreamWorkbook(file) as book:
+            self._stream_info(book, df, format_float, add_profit, chunk_size, number_format, shard_by_year)
+            for sheet_name, df_pivot in pivots.items():
+                book.write_frame(sheet_name, df_pivot, index=True, number_format=sum_format if number_format else None)
+            self._stream_handbooks(book, df)
+
+    def _stream_info(self, book: StreamWorkbook, df, format_float=True, add_profit=True, chunk_size=50000,
+                     number_format=False, shard_by_year=False):
+        """
+        Потоковий запис аркуша Info: форматування та запис частинами по chunk_size рядків (якщо записи не
+        вміщуються на один аркуш - на декілька аркушів, info_shards)
+        """
+        def info_rows(df_shard):
+            for start in range(0, df_shard.shape[0], chunk_size):
+                chunk = self._get_formatted_df(df_shard.iloc[start:start + chunk_size],
+                                               format_float=format_float, add_profit=add_profit)
+                yield from frame_rows(chunk, header=(start == 0))
+
+        info_formats = None
+        if number_format:
+            info_columns = [self.headers[col] for col in self.info_columns(add_profit)]
+            info_formats = {info_columns.index(col) + 1: sum_format for col in self.sum_headers
+                            if col in info_columns}
+        for sheet_name, df_shard in self.info_shards(df, 'g12' if shard_by_year else None):
+            book.write_rows(sheet_name, info_rows(df_shard), number_formats=info_formats)
+
+    @staticmethod
+    def info_shards(df: pd.DataFrame, year_col: str = None) -> list:
+        """
+        Розподіл записів аркуша Info з урахуванням обмеження кількості рядків аркуша Excel (визначається до
+        початку запису). Записи, що вміщуються на один аркуш, залишаються на аркуші Info, інакше - аркуші
+        Info_1, Info_2... або, з year_col, аркуші років Info_2021... (рік, що не вміщується, також ділиться:
+        Info_2021_1, Info_2021_2...). Частини - зрізи/вибірки рядків df, форматування - під час запису.
+
+        :param df: датафрейм записів (неформатований або форматований)
+        :param year_col: колонка року для розподілу по роках (None - послідовними частинами)
+        :return: [(назва аркуша, частина датафрейму)]
+        """
+        max_rows = sheet_rows_limit - 1  # рядок заголовку
+
+        def split(df_part: pd.DataFrame, prefix: str) -> list:
+            parts = range(0, df_part.shape[0], max_rows)
+            return [(f'{prefix}_{n}', df_part.iloc[start:start + max_rows]) for n, start in enumerate(parts, start=1)]
+
+        if df.shape[0] <= max_rows:
+            return [('Info', df)]
+        if year_col is None:
+            return split(df, 'Info')
+        shards = []
+        for year, rows in sorted(df.groupby(year_col, sort=False).indices.items()):
+            df_year = df.take(rows)
+            name = f'Info_{year}'
+            shards += [(name, df_year)] if df_year.shape[0] <= max_rows else split(df_year, name)
+        return shards
+
+    def _stream_handbooks(self, book: StreamWorkbook, df):
+        """Запис довідників осіб (Handbook) та агентів (Agents)"""
+        df_unique_ipn = df[['g3s', 'g2s']].drop_duplicates().reset_index(drop=True).rename(columns=self.headers)
+        book.write_frame('Handbook', df_unique_ipn)
+        book.write_frame('Agents', self._get_formatted_employers(df))
+
+    def write_persons_book(self, file, format_float=True, add_profit=True, chunk_size=50000, number_format=False,
+                           shard_by_year=False):
+        """
+        Запис всіх осіб в одну книгу Excel (потоково, за один прохід по групах платників):
+            - Index: перелік осіб з підсумками та посиланнями на аркуші осіб
+            - Info: спільний аркуш записів (або декілька аркушів - info_shards)
+            - аркуш кожної особи: зведені таблиці (Pt_General, Pt_Feature, Pt_QY) розділами один під одним
+            - Handbook, Agents: довідники
 
-    def save_excel(self, file: Union[str, Path], separate=False, format_float=True, add_profit_column=True):
+        :param number_format: суми - числа з форматом Excel (замість рядків format_float)
+        """
+        if number_format:
+            format_float = False
+        values_format = sum_format if number_format else None
+        persons = list(self.person_rows())
+        sheets = {}
+        for n, p in enumerate(persons, start=1):
+            sheets[p] = sheet_title(f'{n}_{p}')
+
+        # Підсумки осіб для змісту - з рядків Pt_General (одне групування для всіх осіб):
+        totals = self.pivot_tables(add_profit=add_profit)['Pt_General']
+        index = pd.DataFrame({'№': range(1, len(persons) + 1), 'РНОКПП': persons})
+        index['Записів'] = [len(self.person_rows()[p]) for p in persons]
+        index = index.join(totals, on='РНОКПП')
+        if format_float:
+            for col in totals.columns:
+                index[col] = index[col].apply(self.f2s)
+        index['Аркуш'] = [sheet_link(sheets[p], sheets[p]) for p in persons]
+
+        with StreamWorkbook(file) as book:
+            book.write_frame('Index', index.set_index(['№', 'РНОКПП', 'Записів']), index=True,
+                             number_format=values_format)
+            self._stream_info(book, self.df, format_float, add_profit, chunk_size, number_format, shard_by_year)
+            for p in persons:
+                sheet = book.create_sheet(sheets[p])
+                book.append_rows(sheet, [[self.headers['g3s'], p], [sheet_link('Index', 'До змісту')]])
+                pivots = self._format_pivots(self.pivot_tables(person=p, add_profit=add_profit), format_float)
+                for sheet_name, df_pivot in pivots.items():
+                    book.append_rows(sheet, [[], [self.pivot_titles[sheet_name]]])
+                    book.append_frame(sheet, df_pivot, index=True, number_format=values_format)
+            self._stream_handbooks(book, self.df)
+
+    def save_excel(self, file: Union[str, Path], separate=False, format_float=True, add_profit_column=True,
+                   streaming=False, number_format=False, workers: int = 1, one_book=False,
+                   shard_by_year=False) -> str:
         """
         Збереження форматованого файлу таблиці Excel
 
         :param file: назва створюваного файлу
         :param separate: розділення на декілька файлів в разі записів щодо декількох осіб
+            (файл на кожну особу: <назва>_<РНОКПП>.xlsx)
+        :param one_book: з separate - всі особи в одній книзі (аркуш на особу та зміст, write_persons_book)
         :param format_float: форматування сум (12300,00 -> 12 300.00)
         :param add_profit_column: додати колонку розрахунку прибутку (дохід - податок)
+        :param streaming: потоковий запис (openpyxl write-only) - для великих вивантажень
+        :param number_format: суми залишаються числами з форматом Excel "# ##0.00" (замість тексту format_float)
+        :param workers: кількість процесів для separate (1 - у поточному процесі, None - кількість ядер)
+        :param shard_by_year: записи, що не вміщуються на аркуш Info, розподіляються по аркушах років
+            (інакше - Info_1, Info_2...); такі вивантаження завжди записуються потоково
+        :return: текстовий опис помилок запису (порожній рядок - всі файли збережено)
         """
         if type(file) == str:
             file = Path(file)
+        if number_format:
+            format_float = False
+        if self.df.shape[0] >= sheet_rows_limit:
+            streaming = True  # частини аркуша Info форматуються та записуються порціями
 
         if not separate:
-            df = self._get_formatted_df(format_float=format_float, add_profit=add_profit_column)
-            self.write_pt(df, file, add_profit=add_profit_column)
-        else:
-            persons = self.df['g3s'].dropna().unique().tolist()
-            for p in persons:
-                df = self.df.loc[self.df['g3s'] == p]
+            pivots = self._format_pivots(self.pivot_tables(add_profit=add_profit_column), format_float)
+            if streaming:
+                self.write_pt_stream(self.df, file, format_float=format_float, add_profit=add_profit_column,
+                                     pivots=pivots, number_format=number_format, shard_by_year=shard_by_year)
+            else:
+                df = self._get_formatted_df(format_float=format_float, add_profit=add_profit_column)
+                self.write_pt(df, file, add_profit=add_profit_column, pivots=pivots, number_format=number_format,
+                              shard_by_year=shard_by_year)
+            return ''
+        if one_book:
+            self.write_persons_book(file, format_float=format_float, add_profit=add_profit_column,
+                                    number_format=number_format, shard_by_year=shard_by_year)
+            return ''
+
+        options = dict(format_float=format_float, add_profit_column=add_profit_column, streaming=streaming,
+                       number_format=number_format, shard_by_year=shard_by_year)
+        errors = {}
+        if workers == 1:
+            for p in self.person_rows():
                 cur_path = file.with_name(f"{file.stem}_{str(p)}{file.suffix}")
-                df_f = self._get_formatted_df(df, format_float=format_float, add_profit=add_profit_column)
-                self.write_pt(df_f, cur_path, add_profit=add_profit_column)
+                try:
+                    pivots = self._format_pivots(self.pivot_tables(person=p, add_profit=add_profit_column),
+                                                 format_float)
+                    df = self.person_df(p)
+                    if streaming:
+                        self.write_pt_stream(df, cur_path, format_float=format_float, add_profit=add_profit_column,
+                                             pivots=pivots, number_format=number_format, shard_by_year=shard_by_year)
+                    else:
+                        df_f = self._get_formatted_df(df, format_float=format_float, add_profit=add_profit_column)
+                        self.write_pt(df_f, cur_path, add_profit=add_profit_column, pivots=pivots,
+                                      number_format=number_format, shard_by_year=shard_by_year)
+                except Exception as e:
+                    errors[cur_path.name] = str(e)
+        else:
+            errors = self._save_persons_parallel(file, options, workers or os.cpu_count() or 1)
+        return ''.join(f'Помилка запису файлу {name}: {error}\n' for name, error in sorted(errors.items()))
+
+    def _save_persons_parallel(self, file: Path, options: dict, workers: int) -> dict:
+        """
+        Запис файлів Excel окремих осіб пулом процесів: датафрейм розділяється один раз, кожне завдання
+        отримує лише записи однієї особи та відповідних агентів. Першими подаються особи з найбільшою
+        кількістю записів, одночасно в обробці не більше workers * 2 завдань (обмеження пам'яті).
+
+        :return: словник помилок {назва файлу: текст помилки}
+        """
+        rows = self.person_rows()
+        errors = {}
+
+        def person_path(p) -> Path:
+            return file.with_name(f"{file.stem}_{str(p)}{file.suffix}")
+
+        def task_args(p):
+            df = self.person_df(p)
+            employers = self.employers.loc[self.employers.index.isin(df['g6s'].dropna().unique())]
+            return df, employers, person_path(p), options
+
+        def on_error(p, e: Exception):
+            errors[person_path(p).name] = str(e)
+
+        run_bounded(_save_person_excel, rows, task_args, lambda p, result: None, on_error, workers,
+                    size=lambda p: len(rows[p]))
+        return errors
+
+    def export_chunks(self, labels: str = None, add_profit=True, chunk_size=100000):
+        """
+        Частини очищеного датафрейму для текстових експортів (колонки - як на аркуші Info)
+
+        :param labels: назви колонок: None - коди граф (g3s, g8...), 'service' - службові назви
+            (service_col_names: person, income...), 'headers' - заголовки звіту (tech_headers) та опис ознак доходу
+        :param add_profit: додати колонку прибутку
+        :param chunk_size: кількість рядків частини
+        """
+        assert labels in [None, 'service', 'headers'], "Назви колонок: None, 'service' або 'headers'"
+        columns = [col for col in self.info_columns(add_profit) if col in self.df.columns]
+        names = {'service': service_col_names, 'headers': self.headers}.get(labels)
+        for start in range(0, self.df.shape[0], chunk_size):
+            chunk = self.df.iloc[start:start + chunk_size][columns]
+            if labels == 'headers':
+                chunk = chunk.assign(g10=chunk['g10'].map(self.signs).fillna(chunk['g10']))
+            if names is not None:
+                chunk = chunk.rename(columns=names)
+            yield chunk
+
+    def save_csv(self, file: Union[str, Path], labels: str = None, add_profit=True, encoding='utf-8',
+                 delimiter=',', compress: bool = None, compresslevel=6, chunk_size=100000) -> int:
+        """
+        Потоковий запис очищених даних у файл CSV (частинами по chunk_size рядків)
+
+        :param labels: назви колонок (export_chunks)
+        :param encoding: кодування ('utf-8-sig' - для відкриття у Excel)
+        :param compress: стиснення gzip (None - за розширенням файлу .gz)
+        :param compresslevel: рівень стиснення gzip (1 - найшвидше)
+        :return: кількість записаних рядків
+        """
+        return write_csv(self.export_chunks(labels, add_profit, chunk_size), file, encoding=encoding,
+                         delimiter=delimiter, compress=compress, compresslevel=compresslevel)
+
+    def save_ndjson(self, file: Union[str, Path], labels: str = None, add_profit=True, encoding='utf-8',
+                    compress: bool = None, compresslevel=6, chunk_size=100000) -> int:
+        """
+        Потоковий запис очищених даних у файл NDJSON (JSON lines, частинами по chunk_size рядків)
+
+        :param labels: назви колонок (export_chunks)
+        :param compress: стиснення gzip (None - за розширенням файлу .gz)
+        :param compresslevel: рівень стиснення gzip (1 - найшвидше)
+        :return: кількість записаних рядків
+        """
+        return write_ndjson(self.export_chunks(labels, add_profit, chunk_size), file, encoding=encoding,
+                            compress=compress, compresslevel=compresslevel)
+
+    def save_xml(self, file: Union[str, Path], template: 'FileProfitXML' = None, encoding='windows-1251',
+                 source_signs=False, chunk_size=50000) -> int:
+        """
+        Потоковий запис очищених (нормалізованих) даних у файл XML схеми J1703502: DECLARHEAD та службові
+        елементи копіюються з файлу-джерела, рядки таблиці нумеруються заново
+
+        :param template: екземпляр, прочитаний з XML, частини документа якого використовуються
+            (None - власний файл-джерело)
+        :param encoding: кодування файлу
+        :param source_signs: ознаки доходу у вигляді, поданому агентом (g10_src, до заміни кодів декларацій 506,
+            509 на 512) - повторний імпорт файлу відтворює ті самі очищені дані; інакше - нормалізовані ознаки
+        :return: кількість записаних рядків
+        """
+        df = self.df
+        if source_signs and 'g10_src' in df.columns:
+            df = df.assign(g10=df['g10_src'])
+        parts = (template or self).xml_parts
+        return write_declar(file, df, parts=parts, encoding=encoding, chunk_size=chunk_size)
+
+    def append_xml(self, file: Union[str, Path], replace_periods=False) -> str:
+        """
+        Доповнення завантажених даних записами додаткового витягу (нові квартали або виправлені відомості).
+        Новий файл проходить ті самі етапи очищення, а похідні дані (нормалізація декларацій, довідник
+        агентів) перераховуються лише для платників/років/агентів, яких стосуються нові записи.
+
+        :param file: файл XML з додатковими записами
+        :param replace_periods: замінити наявні записи тих самих платників за ті самі квартали (виправлені дані)
+        :return: текстовий опис виявлених помилок
+        """
+        supplement = FileProfitXML(file)
+        if supplement.read_xml():
+            return f'Помилка читання XML файлу {supplement.file.name}\n'
+        warnings = supplement.fill_df()
+        if supplement.df.shape[0] == 0 or 'profit' not in supplement.df.columns:
+            return warnings
+        self.columns.update(supplement.columns)
+        if self.df.shape[0] == 0:
+            self.df = supplement.df
+            self.declar_dropped = supplement.declar_dropped
+            self.employers = supplement.employers
+        else:
+            self.append_df(supplement.df, replace_periods=replace_periods, new_dropped=supplement.declar_dropped)
+        return warnings
+
+    def append_df(self, new: pd.DataFrame, replace_periods=False, new_dropped: pd.DataFrame = None):
+        """
+        Інкрементальне додавання очищених записів (результат fill_df іншого екземпляру) до датафрейму.
+        Виключення проміжних декларацій перераховується для об'єднаних записів (разом з виключеними раніше -
+        declar_dropped), тому заміна річного звіту відновлює виключені ним звіти 6 та 9 міс.
+
+        :param new: очищений датафрейм з колонками profit, year_quad, g10_src
+        :param replace_periods: видалити наявні записи тих самих платників за ті самі роки та квартали
+        :param new_dropped: проміжні декларації, виключені під час очищення нових записів (declar_dropped)
+        """
+        if self.declar_dropped is None:
+            # Без виключених раніше декларацій заміна річного звіту не відновить звіти 6 та 9 міс.:
+            raise ValueError("Доповнення недоступне: невідомі проміжні декларації, виключені під час очищення "
+                             "наявних записів (дані завантажено не з XML або набору даних з ними)")
+        n_kept = self.df.shape[0]
+        old = pd.concat([self.df, self.declar_dropped], ignore_index=True) if len(self.declar_dropped) else self.df
+        if new_dropped is not None and len(new_dropped):
+            new = pd.concat([new, new_dropped], ignore_index=True)
+        keep_old = np.ones(old.shape[0], dtype=bool)
+
+        if replace_periods:
+            periods_new = pd.MultiIndex.from_arrays([new['g3s'], new['g12'], new['g11']])
+            keep_old &= ~pd.MultiIndex.from_arrays([old['g3s'], old['g12'], old['g11']]).isin(periods_new)
+
+        # Виключення декларацій за об'єднаними записами (після заміни):
+        merged = pd.concat([old.loc[keep_old], new], ignore_index=True)
+        drops = self._declaration_drops(merged, sign_col='g10_src').to_numpy()
+
+        # Агенти, статистика яких змінюється: нові записи, видалені наявні та наявні записи, виключення яких
+        # змінилось:
+        was_kept = np.arange(old.shape[0]) < n_kept
+        changed = was_kept[keep_old] == drops[:keep_old.sum()]
+        affected_employers = (set(new.loc[~drops[keep_old.sum():], 'g6s'].dropna()) |
+                              set(old.loc[~keep_old & was_kept, 'g6s'].dropna()) |
+                              set(old.loc[keep_old].loc[changed, 'g6s'].dropna()))
+
+        self.df = merged.loc[~drops].reset_index(drop=True)
+        self.declar_dropped = merged.loc[drops].reset_index(drop=True)
+        self._reset_cache()
+        recount = self.employers_table(self.df.loc[self.df['g6s'].isin(affected_employers)])
+        self.employers = pd.concat([self.employers.drop(index=list(affected_employers), errors='ignore'),
+                                    recount]).sort_index()
+
+    @staticmethod
+    def _declaration_drops(df: pd.DataFrame, sign_col='g10') -> pd.Series:
+        """
+        Маска проміжних декларацій єдиного податку, що перекриваються пізнішим звітом того самого платника
+        за той самий рік (є річний - зайві 6 та 9 міс., є 9 міс. - зайвий піврічний)
+        """
+        codes = df[sign_col].where(df[sign_col].isin(FileProfitXML.declar_codes))
+        latest = codes.groupby([df['g3s'], df['g12']]).transform('max')
+        return codes < latest
 
     @staticmethod
     def _tax_declaration_fix(df: pd.DataFrame):
         """
         Нормалізація доходів зазначених в деклараціях платника єдиного податку:
         виключення піврічних звітів, які включаються 9-річними, формування окремого виду доходу щодо
-        доходу отриманого від підприємницької діяльності (коди 506, 509, 512)
+        доходу отриманого від підприємницької діяльності (коди 506, 509, 512).
+        Початковий код ознаки зберігається у колонці g10_src (для повторної нормалізації при доповненні даних).
+
+        :return: нормалізовані записи та виключені проміжні декларації (з тими самими колонками)
         """
         df = df.copy()
-        # Визначення років, у які подавались декларації:
-        years_with_declar = df.loc[df['g10'].isin([506, 509, 512]), 'g12'].unique()
-        # Перевірка чи в кожному році прийшли річні звіти:
-        for year in years_with_declar:
-            tax_signs_present = df.loc[(df['g12'] == year) & (df['g10'].isin([506, 509, 512])), 'g10'].unique()
-            # Якщо є річний звіт - видалити проміжні
-            if 512 in tax_signs_present:
-                df.drop(df[(df['g12'] == year) & (df['g10'].isin([506, 509]))].index, inplace=True)
-            # Якщо немає річного, але є за 9 місяців - видалити піврічний звіт:
-            elif 509 in tax_signs_present:
-                df.drop(df[(df['g12'] == year) & (df['g10'].isin([506]))].index, inplace=True)
-
-        # Привести ознаки залишених звітів до загального:
-        df.reset_index(inplace=True, drop=True)
+        df['g10_src'] = df['g10']
+        # Привести ознаки звітів до загального:
         df.replace({'g10': {509: 512, 506: 512}}, inplace=True)
-        return df
+
+        # Для кожного платника та року залишається лише останній поданий звіт:
+        drops = FileProfitXML._declaration_drops(df, sign_col='g10_src').to_numpy()
+        return df.loc[~drops].reset_index(drop=True), df.loc[drops].reset_index(drop=True)
 
     @staticmethod
     def fill_na_tax_codes(row):
@@ -301,3 +849,7 @@ class FileProfitXML:
             row['g7s'] = 'ДОХОДИ ВЛАСНОЇ ПІДПРИЄМНИЦЬКОЇ ДІЯЛЬНОСТІ'
         return row
 
+
+def _save_person_excel(df: pd.DataFrame, employers: pd.DataFrame, file: Path, options: dict):
+    """Запис файлу Excel однієї особи в окремому процесі (записи особи та довідник її агентів)"""
+    FileProfitXML.from_df(df, employers=employers).save_excel(file, separate=False, **options)
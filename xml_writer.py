@@ -0,0 +1,155 @@
+"""
+Потоковий запис очищених даних у файл XML схеми J1703502:
+    - кореневий елемент, DECLARHEAD та службові елементи DECLARBODY копіюються з файлу-джерела
+    - рядки таблиці (T1RXXXX<графа> з атрибутом ROWNUM) формуються заново з послідовною нумерацією
+    - структура документа записується XMLGenerator (без побудови дерева ElementTree), рядки таблиці -
+      частинами: текст кожного унікального значення графи екранується один раз
+"""
+
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, Union
+from xml.sax.saxutils import XMLGenerator, escape
+
+import numpy as np
+import pandas as pd
+
+from text_writer import column_text
+
+row_prefix = 'T1RXXXX'
+row_columns = ['g2s', 'g3s', 'g4s', 'g5', 'g6s', 'g7s', 'g8', 'g9', 'g10', 'g11', 'g12']  # порядок граф схеми
+sum_columns = ['g8', 'g9']
+xsi_namespace = 'http://www.w3.org/2001/XMLSchema-instance'
+default_root = {f'{{{xsi_namespace}}}noNamespaceSchemaLocation': 'J1703502.xsd'}
+
+
+def xml_parts(root: ET.Element) -> Dict:
+    """
+    Частини документа, що переносяться у новий файл без змін: атрибути кореня, DECLARHEAD, елементи
+    DECLARBODY до та після рядків таблиці
+
+    :param root: кореневий елемент прочитаного файлу
+    """
+    parts = {'root': dict(root.attrib), 'head': root.find('DECLARHEAD'), 'body_before': [], 'body_after': []}
+    body = root.find('DECLARBODY')
+    rows_started = False
+    for elem in (body if body is not None else []):
+        if str(elem.tag).startswith('T1R'):
+            rows_started = True
+        else:
+            parts['body_after' if rows_started else 'body_before'].append(elem)
+    return parts
+
+
+def _qualified(name: str, prefixes: Dict[str, str]) -> str:
+    """Назва з простором імен ElementTree ({uri}name) -> prefix:name"""
+    if name.startswith('{'):
+        uri, local = name[1:].split('}', 1)
+        if uri not in prefixes:
+            prefixes[uri] = 'xsi' if uri == xsi_namespace else f'ns{len(prefixes)}'
+        return f'{prefixes[uri]}:{local}'
+    return name
+
+
+def _collect_prefixes(parts: Dict, prefixes: Dict[str, str]):
+    """
+    Префікси всіх просторів імен частин документа (корінь, DECLARHEAD, службові елементи DECLARBODY) -
+    оголошуються на кореневому елементі, тому простір імен, що вперше зустрічається у вкладеному елементі,
+    також оголошений
+    """
+    for name in parts['root']:
+        _qualified(name, prefixes)
+    elements = ([parts['head']] if parts['head'] is not None else []) + parts['body_before'] + parts['body_after']
+    for elem in elements:
+        for node in elem.iter():
+            if isinstance(node.tag, str):  # коментарі та інструкції обробки не мають простору імен
+                _qualified(node.tag, prefixes)
+            for name in node.attrib:
+                _qualified(name, prefixes)
+
+
+def _write_element(gen: XMLGenerator, elem: ET.Element, prefixes: Dict[str, str]):
+    """Рекурсивний запис елемента (атрибути, текст, вкладені елементи)"""
+    tag = _qualified(elem.tag, prefixes)
+    gen.startElement(tag, {_qualified(k, prefixes): v for k, v in elem.attrib.items()})
+    if elem.text and elem.text.strip():
+        gen.characters(elem.text)
+    for child in elem:
+        _write_element(gen, child, prefixes)
+    gen.endElement(tag)
+
+
+def _cell_text(column: str):
+    """Функція перетворення значення графи на текст XML"""
+    def to_text(value) -> str:
+        if column in sum_columns:
+            return f'{float(value):.2f}'
+        if isinstance(value, (float, np.floating)) and float(value).is_integer():
+            return str(int(value))
+        return escape(str(value))
+    return to_text
+
+
+def table_rows(df: pd.DataFrame, first_row=1) -> str:
+    """
+    Фрагмент XML рядків таблиці датафрейму (відсутні значення граф не записуються)
+
+    :param first_row: номер (ROWNUM) першого рядка
+    """
+    columns = [col for col in row_columns if col in df.columns]
+    numbers = [f' ROWNUM="{n}">' for n in range(first_row, first_row + df.shape[0])]
+    cells = []
+    for col in columns:
+        tag = row_prefix + col.upper()
+        texts = column_text(df[col], _cell_text(col), na_text=None)
+        cells.append([f'<{tag}{num}{text}</{tag}>\n' if text is not None else ''
+                      for num, text in zip(numbers, texts)])
+    return ''.join(''.join(row) for row in zip(*cells))
+
+
+def write_declar(file: Union[str, Path], df: pd.DataFrame, parts: Dict = None, encoding='windows-1251',
+                 chunk_size=50000) -> int:
+    """
+    Запис датафрейму у файл XML схеми J1703502
+
+    :param df: очищений датафрейм (графи g2s...g12)
+    :param parts: частини документа-джерела (xml_parts); None - лише посилання на схему та порожній DECLARHEAD
+    :param encoding: кодування файлу (символи поза кодуванням - посилання &#...;)
+    :param chunk_size: кількість рядків, що формуються за один раз
+    :return: кількість записаних рядків
+    """
+    parts = parts or {'root': default_root, 'head': None, 'body_before': [], 'body_after': []}
+    prefixes = {}
+    _collect_prefixes(parts, prefixes)
+    root_attrib = {_qualified(k, prefixes): v for k, v in parts['root'].items()}
+    for uri, prefix in prefixes.items():
+        root_attrib[f'xmlns:{prefix}'] = uri
+
+    with open(file, 'w', encoding=encoding, errors='xmlcharrefreplace', newline='') as f:
+        gen = XMLGenerator(f, encoding=encoding, short_empty_elements=True)
+        gen.startDocument()
+        root_attrib = dict(sorted(root_attrib.items(), key=lambda item: not item[0].startswith('xmlns')))
+        gen.startElement('DECLAR', root_attrib)
+        gen.ignorableWhitespace('\n')
+        if parts['head'] is not None:
+            _write_element(gen, parts['head'], prefixes)
+        else:
+            gen.startElement('DECLARHEAD', {})
+            gen.endElement('DECLARHEAD')
+        gen.ignorableWhitespace('\n')
+        gen.startElement('DECLARBODY', {})
+        gen.ignorableWhitespace('\n')
+        for elem in parts['body_before']:
+            _write_element(gen, elem, prefixes)
+            gen.ignorableWhitespace('\n')
+        for start in range(0, df.shape[0], chunk_size):
+            f.write(table_rows(df.iloc[start:start + chunk_size], first_row=start + 1))
+        for elem in parts['body_after']:
+            _write_element(gen, elem, prefixes)
+            gen.ignorableWhitespace('\n')
+        gen.endElement('DECLARBODY')
+        gen.ignorableWhitespace('\n')
+        gen.endElement('DECLAR')
+        gen.ignorableWhitespace('\n')
+        gen.endDocument()
+    return df.shape[0]